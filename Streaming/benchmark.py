@@ -0,0 +1,246 @@
+"""
+Throughput benchmarks of the streaming pipeline
+
+Every stage is measured on its own and then end to end, for each combination of image count,
+resolution, worker count and frame bit depth:
+    decode   read_and_shrink_image through decode_images
+    prepare  prepare_streaming_sequence_item, one item after the other
+    pool     the same items built ahead of time by build_sequence_item_pool
+    queue    handoff between a producer and a consumer thread through a BoundedGaugedQueue
+    feed     run_streaming_on against the device, submit_us_per_item is the feeder's own cost
+    total    background loader and feeder running together in streaming mode
+The feed and total stages need either AJILE_BACKEND=mock or a connected device (--device).
+
+Example:
+    AJILE_BACKEND=mock python benchmark.py --counts 200 1000 --workers 1 4 --bits 1 8 --output results.json
+    AJILE_BACKEND=mock python benchmark.py --compare results.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from typing import *
+
+import numpy as np
+
+
+def parse_benchmark_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the streaming pipeline stages")
+    parser.add_argument("--images", default=None, help="folder of source images, synthetic images are generated when omitted")
+    parser.add_argument("--counts", type=int, nargs="+", default=[200], help="number of synthetic images")
+    parser.add_argument("--resolutions", nargs="+", default=["1140x912"], help="synthetic image sizes as <rows>x<columns>")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1], help="decoding worker counts")
+    parser.add_argument("--bits", type=int, nargs="+", default=[1, 8], help="frame bit depths")
+    parser.add_argument("--frame-time", type=float, default=None, help="frame time in milliseconds used by the feed stages")
+    parser.add_argument("--device", action="store_true", help="feed a connected device instead of the simulated one")
+    parser.add_argument("--output", default=None, help="write the results to this JSON file instead of stdout")
+    parser.add_argument("--compare", default=None, help="previous results file to compare the new results against")
+    return parser.parse_args()
+
+
+def make_synthetic_volume(directory: str, count: int, rows: int, columns: int) -> None:
+    """
+    Write count PNG slices of a bar rotating around the image centre
+    """
+    import cv2
+
+    centre = (columns // 2, rows // 2)
+    radius = min(rows, columns) // 2 - 1
+
+    for index in range(count):
+        angle = 2 * np.pi * index / count
+        end = (int(centre[0] + radius * np.cos(angle)), int(centre[1] + radius * np.sin(angle)))
+        image = np.zeros((rows, columns), dtype=np.uint8)
+        cv2.line(image, centre, end, 255, thickness=max(rows // 50, 1))
+        cv2.imwrite(os.path.join(directory, f"slice_{index:05d}.png"), image)
+
+
+def measure(stage: str, config: Dict[str, Any], item_count: int, byte_count: int, seconds: float, **extra: Any) -> Dict[str, Any]:
+    seconds = max(seconds, 1e-9)
+    result = {
+        "stage": stage,
+        **config,
+        "items": item_count,
+        "seconds": seconds,
+        "items_per_s": item_count / seconds,
+        "us_per_item": seconds / max(item_count, 1) * 1e6,
+        "mb_per_s": byte_count / seconds / 2**20
+    }
+    result.update(extra)
+    return result
+
+
+def simulated_device_stats(device_connected: Any) -> Dict[str, Any]:
+    # mock_ajiledriver only, a real device reports nothing
+    dmds = getattr(device_connected, "dmds", None)
+    if not dmds:
+        return {}
+    dmd = next(iter(dmds.values()))
+    return {"underruns": dmd.underrun_count, "displayed_items": dmd.displayed_items}
+
+
+def open_device(use_device: bool) -> Any:
+    import streaming
+    from driver_backend import mock_requested
+
+    if use_device:
+        return streaming.connect_device()
+    if mock_requested():
+        return streaming.aj.HostSystem()
+    return None
+
+
+def run_configuration(image_directory: str, config: Dict[str, Any], use_device: bool) -> List[Dict[str, Any]]:
+    import streaming
+    from utilities import GaugedQueue, BoundedGaugedQueue
+
+    streaming.PARAMS.FRAME_BIT_DEPTH = config["bit_depth"]
+    streaming.PARAMS.USE_CACHE = False
+
+    paths = streaming.list_image_files(image_directory)
+    results = []
+
+    # decode
+    start = time.perf_counter()
+    images = list(streaming.decode_images(paths, config["workers"]))
+    seconds = time.perf_counter() - start
+    results.append(measure("decode", config, len(images), sum(image.nbytes for image in images), seconds))
+
+    # prepare
+    start = time.perf_counter()
+    items = [streaming.prepare_streaming_sequence_item(image) for image in images]
+    seconds = time.perf_counter() - start
+    frame_bytes = sum(image.nbytes for image in images)
+    results.append(measure("prepare", config, len(items), frame_bytes, seconds))
+
+    # prepare ahead of time
+    start = time.perf_counter()
+    pool = streaming.build_sequence_item_pool(streaming.frame_runs(images, dedup=False), num_workers=config["workers"])
+    seconds = time.perf_counter() - start
+    results.append(measure("pool", config, len(pool), frame_bytes, seconds))
+
+    # queue handoff
+    message_queue = BoundedGaugedQueue(streaming.PARAMS.QUEUE_HIGH_WATER_MARK)
+
+    def produce():
+        for item in items:
+            message_queue.put(item)
+        message_queue.close()
+
+    start = time.perf_counter()
+    producer = threading.Thread(target=produce)
+    producer.start()
+    handed_off = 0
+    while message_queue.get() is not None:
+        handed_off += 1
+    producer.join()
+    seconds = time.perf_counter() - start
+    results.append(measure("queue", config, handed_off, frame_bytes, seconds))
+
+    # feed and end to end
+    device_connected = open_device(use_device)
+    if device_connected is None:
+        print("Skipping the feed stages: set AJILE_BACKEND=mock or pass --device", file=sys.stderr)
+        return results
+
+    message_queue = GaugedQueue()
+    message_queue.extend(items)
+    start = time.perf_counter()
+    feeder = streaming.run_streaming_on(device_connected, message_queue)
+    seconds = time.perf_counter() - start
+    results.append(measure("feed", config, len(items), frame_bytes, seconds, submit_us_per_item=feeder.submit_seconds / max(feeder.items, 1) * 1e6,
+                           **simulated_device_stats(device_connected)))
+
+    device_connected = open_device(use_device)
+    message_queue = BoundedGaugedQueue(streaming.PARAMS.QUEUE_HIGH_WATER_MARK)
+    start = time.perf_counter()
+    loader = threading.Thread(target=streaming.stream_images_into_queue, args=(message_queue, 1, image_directory, config["workers"]))
+    loader.start()
+    streaming.run_streaming_on(device_connected, message_queue)
+    loader.join()
+    seconds = time.perf_counter() - start
+    results.append(measure("total", config, len(paths), frame_bytes, seconds, **simulated_device_stats(device_connected)))
+
+    return results
+
+
+def result_key(result: Dict[str, Any]) -> Tuple:
+    return (result["stage"], result.get("count"), result.get("resolution"), result["workers"], result["bit_depth"])
+
+
+def compare_results(previous: Dict[str, Any], current: Dict[str, Any]) -> None:
+    """
+    Print the items/s ratio of every configuration found in both runs
+    """
+    previous_results = {result_key(result): result for result in previous["results"]}
+
+    print(f"{'stage':<8} {'count':>6} {'resolution':>10} {'workers':>7} {'bits':>4} {'items/s':>12} {'change':>8}")
+    for result in current["results"]:
+        before = previous_results.get(result_key(result))
+        change = f"{result['items_per_s'] / before['items_per_s'] - 1:+.1%}" if before else "new"
+        print(f"{result['stage']:<8} {str(result.get('count')):>6} {str(result.get('resolution')):>10} "
+              f"{result['workers']:>7} {result['bit_depth']:>4} {result['items_per_s']:>12.1f} {change:>8}")
+
+
+def main():
+    arguments = parse_benchmark_arguments()
+
+    import streaming
+
+    if arguments.frame_time is not None:
+        streaming.PARAMS.frameTime_ms = arguments.frame_time
+
+    results = []
+    with tempfile.TemporaryDirectory() as temporary_directory:
+
+        volumes = []
+        if arguments.images is not None:
+            volumes.append((arguments.images, {"count": None, "resolution": None}))
+        else:
+            for resolution in arguments.resolutions:
+                rows, columns = (int(size) for size in resolution.split("x"))
+                for count in arguments.counts:
+                    directory = os.path.join(temporary_directory, f"{resolution}_{count}")
+                    os.makedirs(directory)
+                    make_synthetic_volume(directory, count, rows, columns)
+                    volumes.append((directory, {"count": count, "resolution": resolution}))
+
+        for directory, volume_config in volumes:
+            for workers in arguments.workers:
+                for bit_depth in arguments.bits:
+                    config = {**volume_config, "workers": workers, "bit_depth": bit_depth}
+                    # keep the pipeline's own progress output out of the results
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        results.extend(run_configuration(directory, config, arguments.device))
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "backend": streaming.aj.__name__,
+        "frame_time_ms": streaming.PARAMS.frameTime_ms,
+        "results": results,
+    }
+
+    if arguments.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(arguments.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+
+    if arguments.compare is not None:
+        with open(arguments.compare, "r") as previous_file:
+            compare_results(json.load(previous_file), report)
+
+
+if __name__ == "__main__":
+    main()
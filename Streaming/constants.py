@@ -3,7 +3,6 @@ Here we define the constants and settings required by the project
 """
 
 from enum import IntEnum
-import ajiledriver as aj
 
 # Specify the project name
 PROJECT_TITLE: str = "DIP-Streaming"
@@ -11,6 +10,9 @@ PROJECT_TITLE: str = "DIP-Streaming"
 # Specify the source folder of images we want to load 
 IMAGE_FOLDER_NAME: str = "./wolfrunNEW_3blade1995"
 
+# Specify the folder where preprocessed volumes are cached
+CACHE_FOLDER_NAME: str = "./.frame_cache"
+
 class ErrorType(IntEnum):
     # Error type mapping for the defined errors in Ajile Driver
     ERROR_NONE=0,
@@ -106,8 +108,11 @@ class AJParameters:
     netmask = "255.255.255.0"
     gateway = "0.0.0.0"
     port = 5005
-    commInterface = aj.USB2_INTERFACE_TYPE
+    commInterface = CommunicationInterfaceTypeEnum.USB2_INTERFACE_TYPE
     deviceNumber = 0
+    DEVICE_NUMBERS = [] # USB3 device numbers of every projector in multi-device mode
+    DEVICE_ADDRESSES = [] # IP addresses of every projector in multi-device mode
+    SHARD_MODE = "interleave" # Split of the frames between projectors: interleave (frame i to projector i % N) or block
 
     # Default Components
     deviceType = DeviceTypeEnum.DMD_4500_DEVICE_TYPE
@@ -120,11 +125,53 @@ class AJParameters:
     frameTime_ms = 0.150 # frame time in milliseconds
     sequenceID = 1
     
-    STACK_COUNT = 1 # Number of time the Message Queue stacking itself, each time doubles it size
+    MOTOR_SPEED_RPM = 0.0 # Motor speed the frame time is derived from, 0 keeps the static frameTime_ms
+    TICKS_PER_REVOLUTION = 1600 # Frames projected per motor revolution
+    MIN_FRAME_TIME_MS = 0.04 # Shortest frame time accepted for the DMD, 25 kHz leaves room for the 866.5 rev/min, 1600 ticks operating point (43.3us)
+    MOTOR_SPEED_SMOOTHING = 0.2 # Weight of a new speed measurement in the moving average
+    HALL_SENSOR_SYNC = False # Follow the motor speed measured by the Sync controller's Hall sensor, MOTOR_SPEED_RPM is the starting speed
+    
+    PLAYBACK_LOOPS = 16 # Number of times the volume is projected, 0 repeats forever
+    
+    NUM_WORKERS = 0 # Number of image decoding workers, 0 uses every core
+    USE_PROCESSES = False # Decode with a process pool instead of a thread pool
+    
+    FRAME_BIT_DEPTH = 1 # 1 streams packed binary frames, 8 streams greyscale and lets the driver convert
+    BINARY_THRESHOLD = 127 # Greyscale level above which a pixel is on in 1-bit frames
+    GRAYSCALE_BITPLANES = False # Stream 8 packed bitplanes per slice, sharing the frame time with the DMDGrayscaleFrameTime weights
+    GRAYSCALE_SLICE_TIME_MS = 38.25 # Frame time of a bitplane slice when -f is not given, the sum of DMDGrayscaleFrameTime at 100000 ticks per ms
+    AUTO_ROI = True # Crop frames to the bounding box of the volume, enables lite mode when narrower than the DMD
+    DEDUP_FRAMES = True # Send runs of identical frames once with a repeat count
+    DROP_BLANK_FRAMES = False # Skip all-black frames entirely, this shifts the timing of the following frames
+    USE_CACHE = True # Memory-map preprocessed frames from CACHE_FOLDER_NAME when the source folder is unchanged
+    
+    STREAMING_MODE = False # Load images in the background while projecting
+    QUEUE_HIGH_WATER_MARK = 512 # Maximum number of prepared items held in memory in streaming mode
+    START_PRELOAD_ITEMS = 256 # Items on the device before the sequence starts, 0 waits for a full FIFO
+    STREAM_AUTO_ROI = False # Also crop in streaming mode, at the cost of a pass over the whole volume before the first item
+    RECYCLE_ITEMS = False # Keep the items of the first loop in streaming mode and submit them again instead of reloading
+    
+    ARCHIVE_FILE = None # Read preprocessed frames from this frame archive instead of decoding IMAGE_FOLDER_NAME
+    STL_FILE = None # Slice this STL model along the helix instead of reading IMAGE_FOLDER_NAME
+    VOLUME_FILE = None # Slice this .npy (layers, rows, columns) voxel volume along the helix instead
+    HELIX_BLADES = 1 # Number of blades of the helical screen
+    HELIX_HEIGHT = 912.0 # Rise of a blade, in DMD pixels
+    
+    STATS_INTERVAL_S = 1.0 # Interval between queue statistics reports, 0 disables them
+    TRACE_FILE = None # Record every frame's stages and the device FIFO level, and write them to this Chrome trace JSON file
+    
+    STATE_POLL_MIN_INTERVAL_S = 0.0005 # First delay between device state queries, doubled after every unchanged query
+    STATE_POLL_MAX_INTERVAL_S = 0.02 # Upper bound of the device state polling backoff
+    STATE_TIMEOUT_S = 10.0 # How long to wait for the device to start or stop
+    KEY_POLL_INTERVAL_S = 0.05 # How often the feeder checks for a keypress while the device FIFO is full
     
     MaxStreamingMemoryUsage = 0x80000000 # 2024 MB
     MaxStreamingFIFOSize = 0x02000000  # 32 M
     
+    SUBMIT_BATCH_SIZE = 32 # Items sent to the device per refill, between two FIFO level queries
+    REFILL_LOW_WATERMARK = 0 # Refill the device once it holds fewer items than this, 0 uses half of its capacity
+    
+    # Binary-weighted frame times of bitplanes 0 to 7, in driver ticks
     DMDGrayscaleFrameTime = [15000, 30000, 60000, 120000, 240000, 480000, 960000, 1920000]
     DMDGrayscaleLEDTimes = [15000, 30000, 60000, 120000, 240000, 480000, 960000, 1920000]
     
@@ -0,0 +1,85 @@
+import time
+import asyncio
+from typing import *
+
+from driver_backend import aj
+from constants import *
+
+
+class DeviceStateWatcher:
+    """
+    Waits on the run state and the streaming FIFO level of one DMD without spinning
+    Queries are spaced with an exponential backoff between a min and max interval, and are made
+    from the waiting thread, so they never race with the feeder's driver calls.
+    Listeners added with on_change are called whenever a new run state or FIFO level is observed
+    """
+    
+    def __init__(self, device_connected: Any, dmdIndex: int, min_interval_s: Optional[float] = None, max_interval_s: Optional[float] = None):
+        self.device_connected = device_connected
+        self.driver = device_connected.GetDriver()
+        self.dmdIndex = dmdIndex
+        
+        self.min_interval_s = AJParameters.STATE_POLL_MIN_INTERVAL_S if min_interval_s is None else min_interval_s
+        self.max_interval_s = AJParameters.STATE_POLL_MAX_INTERVAL_S if max_interval_s is None else max_interval_s
+        
+        self.last_run_state = None
+        self.last_fifo_level = None
+        self.listeners = []
+        
+    def on_change(self, callback: Callable[[Optional[int], Optional[int]], None]) -> None:
+        # callback(run_state, fifo_level)
+        self.listeners.append(callback)
+    
+    def _notify(self) -> None:
+        for callback in self.listeners:
+            callback(self.last_run_state, self.last_fifo_level)
+    
+    def run_state(self) -> int:
+        run_state = self.device_connected.GetDeviceState(self.dmdIndex).RunState()
+        if run_state != self.last_run_state:
+            self.last_run_state = run_state
+            self._notify()
+        return run_state
+    
+    def fifo_level(self) -> int:
+        fifo_level = self.driver.GetNumStreamingSequenceItems(self.dmdIndex)
+        if fifo_level != self.last_fifo_level:
+            self.last_fifo_level = fifo_level
+            self._notify()
+        return fifo_level
+    
+    def wait_for(self, condition: Callable[[], bool], timeout_s: Optional[float] = None) -> bool:
+        """
+        Poll condition with backoff until it holds (True) or timeout_s elapses (False)
+        A timeout of None waits forever
+        """
+        deadline = None if timeout_s is None else time.perf_counter() + timeout_s
+        interval = self.min_interval_s
+        
+        while not condition():
+            if deadline is not None:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    return False
+                time.sleep(min(interval, remaining))
+            else:
+                time.sleep(interval)
+            interval = min(interval * 2, self.max_interval_s)
+        
+        return True
+    
+    async def wait_for_async(self, condition: Callable[[], bool], timeout_s: Optional[float] = None) -> bool:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.wait_for, condition, timeout_s)
+    
+    def wait_until_stopped(self, timeout_s: Optional[float] = None) -> bool:
+        return self.wait_for(lambda: self.run_state() == aj.RUN_STATE_STOPPED, timeout_s)
+    
+    def wait_until_running(self, timeout_s: Optional[float] = None) -> bool:
+        return self.wait_for(lambda: self.run_state() == aj.RUN_STATE_RUNNING, timeout_s)
+    
+    def wait_until_not_running(self, timeout_s: Optional[float] = None) -> bool:
+        return self.wait_for(lambda: self.run_state() != aj.RUN_STATE_RUNNING, timeout_s)
+    
+    def wait_for_fifo_below(self, watermark: int, timeout_s: Optional[float] = None) -> bool:
+        return self.wait_for(lambda: self.fifo_level() < watermark, timeout_s)
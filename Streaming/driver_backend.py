@@ -0,0 +1,41 @@
+"""
+Selects the ajiledriver implementation used by every module
+
+Set AJILE_BACKEND=mock to run against the simulated DMD in mock_ajiledriver.
+Without the environment variable the real driver is used, and a missing or broken
+ajiledriver install fails with its ImportError rather than projecting to nothing.
+The driver is only imported on first use of aj, so importing the project stays cheap and the
+import can be overlapped with other startup work by calling aj.load() from a thread
+"""
+
+import os
+import threading
+from typing import *
+
+
+def mock_requested() -> bool:
+    return os.environ.get("AJILE_BACKEND", "").lower() == "mock"
+
+
+class LazyDriver:
+    
+    def __init__(self):
+        self.module = None
+        self.lock = threading.Lock()
+    
+    def load(self) -> Any:
+        with self.lock:
+            if self.module is None:
+                if mock_requested():
+                    import mock_ajiledriver as module
+                else:
+                    import ajiledriver as module
+                self.module = module
+            return self.module
+    
+    def __getattr__(self, name: str) -> Any:
+        # only called for names the proxy itself does not have, i.e. the driver's
+        return getattr(self.module if self.module is not None else self.load(), name)
+
+
+aj = LazyDriver()
@@ -1,10 +1,12 @@
 from typing import *
 import sys
-import ajiledriver as aj
+from driver_backend import aj
 import os.path
 import cv2
 import numpy
 
+from device_watcher import DeviceStateWatcher
+
 class ProjectorSettings:
     # default connection settings
     ipAddress = "192.168.200.1"
@@ -111,6 +113,8 @@ def RunDmdExample(createFunction):
     
     print(f"sequence size: {sequence.Size():x}")
    
+    watcher = DeviceStateWatcher(ajileSystem, componentIndex)
+
     # stop any existing project from running on the device
     ajileSystem.GetDriver().StopSequence(componentIndex)
 
@@ -137,11 +141,11 @@ def RunDmdExample(createFunction):
 
         # wait for the sequence to start
         print ("Waiting for sequence %d to start" % (sequence.ID(),))
-        while ajileSystem.GetDeviceState(componentIndex).RunState() != aj.RUN_STATE_RUNNING: pass
+        watcher.wait_until_running()
 
         if parameters.repeatCount == 0:
             input("Sequence repeating forever. Press Enter to stop the sequence")
             ajileSystem.GetDriver().StopSequence(componentIndex)
 
         print ("Waiting for the sequence to stop.")
-        while ajileSystem.GetDeviceState(componentIndex).RunState() == aj.RUN_STATE_RUNNING: pass
+        watcher.wait_until_not_running()
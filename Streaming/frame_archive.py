@@ -0,0 +1,223 @@
+"""
+Single-file archive of preprocessed frames with random access by slice index
+
+Layout, little endian:
+    header      magic "AJFA", version, frame count, rows, stored columns, planes,
+                offset of the index table, length of the metadata
+    metadata    JSON with the preprocessing settings the frames were made with
+    frames      one record per frame, stored raw, run-length encoded or zlib compressed
+    index       (offset, size, method) of every frame
+
+Frames are uint8 arrays of shape (rows, stored columns, planes), as produced by
+read_and_shrink_image: packed binary, greyscale or packed bitplanes. The reader memory-maps the
+file, so raw frames are zero-copy views and the rest is decoded straight from the page cache.
+
+Import an image folder with the same options as streaming.py:
+    python frame_archive.py ./wolfrunNEW_3blade1995 volume.ajfa --compression auto -w 8
+"""
+
+import os
+import json
+import mmap
+import zlib
+import time
+import struct
+import argparse
+import numpy as np
+from typing import *
+
+ARCHIVE_MAGIC = b"AJFA"
+ARCHIVE_VERSION = 1
+ARCHIVE_HEADER = struct.Struct("<4sHxxIIIIQI")
+ARCHIVE_INDEX = np.dtype([("offset", "<u8"), ("size", "<u4"), ("method", "u1")])
+
+# per-frame storage methods
+STORED_RAW = 0
+STORED_RLE = 1
+STORED_ZLIB = 2
+COMPRESSION_METHODS = {"none": (STORED_RAW,), "rle": (STORED_RLE,), "zlib": (STORED_ZLIB,), "auto": (STORED_RLE, STORED_ZLIB)}
+
+RLE_MAX_RUN = 0xFFFF
+
+
+def rle_encode(data: np.ndarray) -> bytes:
+    """
+    Byte runs of data as a run count, the uint16 run lengths and the run values
+    Runs are found with numpy; blank borders and solid regions of packed frames shrink to a few bytes
+    """
+    data = data.ravel()
+    starts = np.concatenate(([0], np.flatnonzero(data[1:] != data[:-1]) + 1))
+    lengths = np.diff(np.append(starts, len(data)))
+    values = data[starts]
+
+    # split the runs a uint16 cannot count
+    if lengths.max() > RLE_MAX_RUN:
+        pieces = -(-lengths // RLE_MAX_RUN)
+        values = np.repeat(values, pieces)
+        split_lengths = np.full(pieces.sum(), RLE_MAX_RUN, dtype=np.int64)
+        split_lengths[np.cumsum(pieces) - 1] = lengths - (pieces - 1) * RLE_MAX_RUN
+        lengths = split_lengths
+
+    return struct.pack("<I", len(lengths)) + lengths.astype("<u2").tobytes() + values.astype(np.uint8).tobytes()
+
+
+def rle_decode(buffer: Any, offset: int = 0) -> np.ndarray:
+    (count,) = struct.unpack_from("<I", buffer, offset)
+    lengths = np.frombuffer(buffer, dtype="<u2", count=count, offset=offset + 4)
+    values = np.frombuffer(buffer, dtype=np.uint8, count=count, offset=offset + 4 + 2 * count)
+    return np.repeat(values, lengths)
+
+
+class FrameArchiveWriter:
+    """
+    Appends frames to a new archive; the file only appears under path once close() succeeds
+    compression is none, rle, zlib, or auto to keep the smaller of rle and zlib for each frame;
+    zlib is skipped when RLE already shrinks a frame 16 times.
+    A frame is stored raw whenever compressing it would not save anything
+    """
+
+    def __init__(self, path: str, metadata: Optional[Dict[str, Any]] = None, compression: str = "auto", zlib_level: int = 1):
+        if compression not in COMPRESSION_METHODS:
+            raise ValueError(f"Unknown compression {compression}, expected one of {', '.join(COMPRESSION_METHODS)}")
+        self.path = path
+        self.temp_path = path + ".tmp"
+        self.methods = COMPRESSION_METHODS[compression]
+        self.zlib_level = zlib_level
+        self.metadata = json.dumps(metadata or {}, sort_keys=True).encode("utf-8")
+
+        self.shape = None
+        self.index = []
+        self.raw_bytes = 0
+        self.file = open(self.temp_path, "wb")
+        self.file.write(bytes(ARCHIVE_HEADER.size))
+        self.file.write(self.metadata)
+
+    def __enter__(self) -> "FrameArchiveWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+            os.remove(self.temp_path)
+
+    def encode(self, frame: np.ndarray) -> Tuple[int, bytes]:
+        raw = frame.tobytes()
+        best = (STORED_RAW, raw)
+        for method in self.methods:
+            if method == STORED_RAW:
+                continue
+            # mostly blank frames are already tiny after RLE, zlib would only cost time
+            if method == STORED_ZLIB and best[0] == STORED_RLE and len(best[1]) * 16 < len(raw):
+                continue
+            data = rle_encode(frame) if method == STORED_RLE else zlib.compress(raw, self.zlib_level)
+            if len(data) < len(best[1]):
+                best = (method, data)
+        return best
+
+    def write(self, frame: np.ndarray) -> None:
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        if frame.ndim == 2:
+            frame = frame[:, :, None]
+        if self.shape is None:
+            self.shape = frame.shape
+        elif frame.shape != self.shape:
+            raise ValueError(f"Frame {len(self.index)} has shape {frame.shape}, the archive holds {self.shape}")
+
+        method, data = self.encode(frame)
+        self.index.append((self.file.tell(), len(data), method))
+        self.file.write(data)
+        self.raw_bytes += frame.nbytes
+
+    def close(self) -> None:
+        index_offset = self.file.tell()
+        self.file.write(np.array(self.index, dtype=ARCHIVE_INDEX).tobytes())
+
+        rows, columns, planes = self.shape if self.shape is not None else (0, 0, 0)
+        self.file.seek(0)
+        self.file.write(ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, len(self.index), rows, columns, planes, index_offset, len(self.metadata)))
+        self.file.close()
+        os.replace(self.temp_path, self.path)
+
+
+class FrameArchive:
+    """
+    Memory-mapped reader of a frame archive
+    archive[i] decodes slice i, iterating reads the frames in file order
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as archive_file:
+            self.buffer = mmap.mmap(archive_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(self.buffer, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+            # frames are mostly read in order, let the kernel read ahead
+            self.buffer.madvise(mmap.MADV_SEQUENTIAL)
+
+        magic, version, count, rows, columns, planes, index_offset, metadata_length = ARCHIVE_HEADER.unpack_from(self.buffer, 0)
+        if magic != ARCHIVE_MAGIC or version != ARCHIVE_VERSION:
+            raise ValueError(f"{path} is not a version {ARCHIVE_VERSION} frame archive")
+
+        self.path = path
+        self.shape = (rows, columns, planes)
+        self.frame_bytes = rows * columns * planes
+        self.metadata = json.loads(bytes(self.buffer[ARCHIVE_HEADER.size:ARCHIVE_HEADER.size + metadata_length]).decode("utf-8"))
+        self.index = np.frombuffer(self.buffer, dtype=ARCHIVE_INDEX, count=count, offset=index_offset)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __getitem__(self, position: int) -> np.ndarray:
+        offset, size, method = self.index[position]
+        offset = int(offset)
+        if method == STORED_RAW:
+            frame = np.frombuffer(self.buffer, dtype=np.uint8, count=self.frame_bytes, offset=offset)
+        elif method == STORED_RLE:
+            frame = rle_decode(self.buffer, offset)
+        else:
+            frame = np.frombuffer(zlib.decompress(self.buffer[offset:offset + int(size)]), dtype=np.uint8)
+        return frame.reshape(self.shape)
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        for position in range(len(self)):
+            yield self[position]
+
+    def stored_bytes(self) -> int:
+        return int(self.index["size"].sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import an image folder into a frame archive", epilog="Other options are passed to streaming.py, e.g. --frame-bits, --bitplanes, --threshold or -w")
+    parser.add_argument("image_directory")
+    parser.add_argument("output")
+    parser.add_argument("--compression", default="auto", choices=sorted(COMPRESSION_METHODS))
+    parser.add_argument("--zlib-level", type=int, default=1)
+    arguments, streaming_arguments = parser.parse_known_args()
+
+    import streaming
+    from utilities import get_command_arguments
+    streaming.configure(get_command_arguments(streaming_arguments))
+    PARAMS = streaming.PARAMS
+
+    paths = streaming.list_image_files(arguments.image_directory)
+    metadata = {
+        "source": os.path.abspath(arguments.image_directory),
+        "frame_bit_depth": PARAMS.FRAME_BIT_DEPTH,
+        "binary_threshold": PARAMS.BINARY_THRESHOLD,
+        "grayscale_bitplanes": PARAMS.GRAYSCALE_BITPLANES,
+    }
+
+    start = time.perf_counter()
+    with FrameArchiveWriter(arguments.output, metadata, arguments.compression, arguments.zlib_level) as writer:
+        for np_image in streaming.decode_images(paths):
+            writer.write(np_image)
+    elapsed = time.perf_counter() - start
+
+    stored = os.path.getsize(arguments.output)
+    source = sum(os.path.getsize(path) for path in paths)
+    print(f"Archived {len(paths)} frames in {elapsed:.3f}s: {stored / 2**20:.1f} MB, "
+          f"{stored / max(writer.raw_bytes, 1):.1%} of the frames and {stored / max(source, 1):.1%} of the image files")
+
+
+if __name__ == "__main__":
+    main()
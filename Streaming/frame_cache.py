@@ -0,0 +1,103 @@
+import os
+import json
+import hashlib
+import numpy as np
+from typing import *
+
+from constants import *
+
+
+def volume_cache_key(paths: List[str], settings: Dict[str, Any]) -> str:
+    """
+    Digest of every source file (path, mtime, size) and of the preprocessing settings
+    Touching, replacing or adding a slice, or changing a setting, gives a different key
+    """
+    entries = []
+    for path in paths:
+        stat = os.stat(path)
+        entries.append([os.path.abspath(path), stat.st_mtime_ns, stat.st_size])
+    
+    payload = json.dumps({"files": entries, "settings": settings}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cache_file_paths(image_directory: str, cache_directory: str = CACHE_FOLDER_NAME) -> Tuple[str, str]:
+    # One cache per source folder, so a stale cache is overwritten instead of piling up
+    name = hashlib.sha256(os.path.abspath(image_directory).encode("utf-8")).hexdigest()[:16]
+    base = os.path.join(cache_directory, name)
+    return base + ".npy", base + ".json"
+
+
+def open_cached_volume(image_directory: str, key: str, cache_directory: str = CACHE_FOLDER_NAME) -> Optional[np.ndarray]:
+    """
+    Memory-map the cached volume if its manifest matches key, None otherwise
+    Indexing or iterating the result hands out zero-copy views of each frame
+    """
+    volume_path, manifest_path = cache_file_paths(image_directory, cache_directory)
+    
+    try:
+        with open(manifest_path, "r") as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        return None
+    
+    if manifest.get("key") != key:
+        return None
+    
+    try:
+        return np.load(volume_path, mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+
+
+def write_cached_volume(image_directory: str, key: str, images: Iterable[np.ndarray], count: int, cache_directory: str = CACHE_FOLDER_NAME) -> Iterator[np.ndarray]:
+    """
+    Pass images through unchanged while writing them into the cache
+    The manifest is written last, so an interrupted run never leaves a cache that looks valid.
+    Volumes whose frames differ in shape are streamed but not cached
+    """
+    os.makedirs(cache_directory, exist_ok=True)
+    volume_path, manifest_path = cache_file_paths(image_directory, cache_directory)
+    temp_volume_path = volume_path + ".tmp"
+    temp_manifest_path = manifest_path + ".tmp"
+    
+    # invalidate the previous cache before its volume gets replaced
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    
+    volume = None
+    cacheable = True
+    written = 0
+    
+    try:
+        for np_image in images:
+            if cacheable:
+                if volume is None:
+                    volume = np.lib.format.open_memmap(temp_volume_path, mode="w+", dtype=np_image.dtype, shape=(count,) + np_image.shape)
+                
+                if np_image.shape == volume.shape[1:] and np_image.dtype == volume.dtype:
+                    volume[written] = np_image
+                    written += 1
+                else:
+                    print(f"Frame cache disabled: frame {written} has shape {np_image.shape}, expected {volume.shape[1:]}")
+                    cacheable = False
+            
+            yield np_image
+        
+        if cacheable and volume is not None and written == count:
+            volume.flush()
+            volume = None
+            os.replace(temp_volume_path, volume_path)
+            
+            with open(temp_manifest_path, "w") as manifest_file:
+                json.dump({"key": key, "image_directory": os.path.abspath(image_directory), "count": count}, manifest_file)
+            os.replace(temp_manifest_path, manifest_path)
+            
+            print(f"Cached {count} preprocessed frames in {volume_path}")
+    
+    finally:
+        # release the memmap before removing a partial file
+        volume = None
+        for path in (temp_volume_path, temp_manifest_path):
+            if os.path.exists(path):
+                os.remove(path)
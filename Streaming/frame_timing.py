@@ -0,0 +1,102 @@
+import os
+import sys
+import time
+import threading
+from typing import *
+
+from driver_backend import aj, mock_requested
+from constants import *
+from utilities import calc_frame_time_from_motor_speed, min_slice_time_ms, split_slice_time
+
+
+class FrameTimingEngine:
+    """
+    Keeps the frame time locked to the measured motor speed
+    Speed measurements (rev/min, or the interval between Hall sensor edges) can arrive from any 
+    thread and are smoothed with an exponential moving average. The feeder calls apply() on each
+    item right before it is submitted, so only items not yet on the device pick up a new timing.
+    With bitplanes the frame time is the slice time, split between the planes by split_slice_time
+    """
+    
+    def __init__(self, motor_speed: float, number_of_ticks: Optional[int] = None, smoothing: Optional[float] = None, bitplanes: Optional[bool] = None,
+                 min_frame_time: Optional[float] = None):
+        self.number_of_ticks = AJParameters.TICKS_PER_REVOLUTION if number_of_ticks is None else number_of_ticks
+        self.smoothing = AJParameters.MOTOR_SPEED_SMOOTHING if smoothing is None else smoothing
+        self.bitplanes = AJParameters.GRAYSCALE_BITPLANES if bitplanes is None else bitplanes
+        # the least significant bitplane has to stay above the DMD minimum too
+        self.min_frame_time_ms = min_slice_time_ms(self.bitplanes, min_frame_time)
+        self.lock = threading.Lock()
+        
+        self.motor_speed = motor_speed
+        self.frame_time_ms = calc_frame_time_from_motor_speed(motor_speed, self.number_of_ticks, self.min_frame_time_ms)
+        self.frame_time_ticks = aj.FromMSec(self.frame_time_ms)
+        self.plane_ticks = split_slice_time(self.frame_time_ticks)
+        self.rejected_measurements = 0
+    
+    def update_motor_speed(self, motor_speed: float) -> None:
+        with self.lock:
+            smoothed = (1 - self.smoothing) * self.motor_speed + self.smoothing * motor_speed
+            try:
+                frame_time_ms = calc_frame_time_from_motor_speed(smoothed, self.number_of_ticks, self.min_frame_time_ms)
+            except ValueError:
+                # keep the last valid timing rather than stalling the projection
+                self.rejected_measurements += 1
+                return
+            
+            self.motor_speed = smoothed
+            self.frame_time_ms = frame_time_ms
+            self.frame_time_ticks = aj.FromMSec(frame_time_ms)
+            self.plane_ticks = split_slice_time(self.frame_time_ticks)
+    
+    def update_from_edge_interval(self, seconds_between_edges: float, edges_per_revolution: int) -> None:
+        # e.g. the time between two Hall sensor edges measured by the Sync controller
+        if seconds_between_edges <= 0:
+            self.rejected_measurements += 1
+            return
+        self.update_motor_speed(60 / (seconds_between_edges * edges_per_revolution))
+    
+    def apply(self, streamingSeqItem: Any) -> None:
+        if self.bitplanes:
+            for streamingFrame, plane_ticks in zip(streamingSeqItem.Frames(), self.plane_ticks):
+                streamingFrame.SetFrameTime(plane_ticks)
+            return
+        frame_time_ticks = self.frame_time_ticks
+        for streamingFrame in streamingSeqItem.Frames():
+            streamingFrame.SetFrameTime(frame_time_ticks)
+
+
+def follow_hall_sensor(timing: FrameTimingEngine) -> Any:
+    """
+    Feed every Hall sensor edge interval measured by the Sync controller to timing
+    With AJILE_BACKEND=mock the controller is simulated, with the motor turning at timing.motor_speed.
+    Returns the running HallSensorReader, its thread stops with the program
+    """
+    # the Sync package sits next to the Streaming scripts
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from Sync import STmic, HallSensorReader
+    
+    sample_period = None
+    if mock_requested():
+        from Sync.simulator import HallWaveform, SimulatedController
+        simulator = SimulatedController(HallWaveform(timing.motor_speed, start_time=time.perf_counter()))
+        sample_period = simulator.sample_period
+        controller = STmic(simulator)
+    else:
+        controller = STmic()
+    
+    # single intervals are only known to a few samples, average them over a group of edges
+    edges_per_update = 64
+    pending = []
+    
+    def on_edge(event: Any) -> None:
+        # the first edge has no interval yet
+        if event.interval <= 0:
+            return
+        pending.append(event.interval)
+        if len(pending) == edges_per_update:
+            timing.update_from_edge_interval(sum(pending) / edges_per_update, STmic.HALL_SENSOR_COUNT)
+            pending.clear()
+    
+    reader = HallSensorReader(controller, sample_period=sample_period, callbacks=[on_edge])
+    reader.start()
+    return reader
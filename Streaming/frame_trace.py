@@ -0,0 +1,147 @@
+"""
+Opt-in per-frame timeline of the streaming pipeline, exported as Chrome trace JSON
+
+Every stage a frame goes through is recorded as a span with the frame's id: the image decode on
+its worker, the wait for the next frame of the source, the sequence item preparation, the queue
+put and get, and the submission to the device. The id is the index of the source frame, the
+first one of its run for an item standing for several identical frames, and the playback loop,
+so a frame can be followed from its disk read to its submission on every loop. Device FIFO
+levels are recorded as counters, and every time the FIFO of a running device runs dry while items
+are still to come is recorded as an underrun span.
+
+Recording a span is two perf_counter_ns calls and a list append, events are only converted when
+the trace is written. Open the file in https://ui.perfetto.dev or chrome://tracing
+"""
+
+import os
+import json
+import time
+import threading
+import numpy as np
+from typing import *
+
+
+class FrameTracer:
+    """
+    Collects the spans, counters and instants of one run from any thread
+    The feeder samples the FIFO level before every submission while the sequence runs, so an
+    underrun is seen even when the device ran dry while the feeder was blocked on its queue
+    """
+
+    def __init__(self):
+        self.origin_ns = time.perf_counter_ns()
+        self.events = [] # (phase, name, start_ns, end_ns, thread ident, (frame, loop) or counter value)
+        self.thread_names = {}
+        self.underruns = 0
+        self.item_frames = {} # id of a sequence item -> its first source frame
+        self.loop = 0 # playback loop of the pass being loaded, for the decode workers
+
+    def _thread(self) -> int:
+        ident = threading.get_ident()
+        if ident not in self.thread_names:
+            self.thread_names[ident] = threading.current_thread().name
+        return ident
+
+    def span(self, stage: str, start_ns: int, frame: int = -1, end_ns: Optional[int] = None, loop: int = 0) -> None:
+        # stage of a source frame in a playback loop from start_ns until end_ns, now by default
+        end_ns = time.perf_counter_ns() if end_ns is None else end_ns
+        self.events.append(("X", stage, start_ns, end_ns, self._thread(), (frame, loop)))
+
+    def counter(self, name: str, value: int) -> None:
+        now = time.perf_counter_ns()
+        self.events.append(("C", name, now, now, self._thread(), value))
+
+    def instant(self, name: str) -> None:
+        now = time.perf_counter_ns()
+        self.events.append(("i", name, now, now, self._thread(), -1))
+
+    def traced_frames(self, frames: Iterable[np.ndarray], stage: str = "load", loop: int = 0) -> Iterator[np.ndarray]:
+        # time the wait for every frame of one pass over a source
+        self.loop = loop
+        frames = iter(frames)
+        index = 0
+        while True:
+            start = time.perf_counter_ns()
+            frame = next(frames, None)
+            if frame is None:
+                return
+            self.span(stage, start, index, loop=loop)
+            index += 1
+            yield frame
+
+    def tag(self, item: Any, frame: int) -> None:
+        # remember the first source frame of a sequence item, for the spans of the queues and the feeder
+        self.item_frames[id(item)] = frame
+
+    def frame_of(self, item: Any) -> int:
+        return self.item_frames.get(id(item), -1)
+
+    def watch_fifo(self, watcher: Any, label: str, running: Callable[[], bool]) -> "FifoProbe":
+        # FIFO levels the watcher observes go to the probe as well
+        probe = FifoProbe(self, label, running)
+        watcher.on_change(lambda run_state, fifo_level: None if fifo_level is None else probe.sample(fifo_level))
+        return probe
+
+    def stage_durations(self) -> Dict[str, np.ndarray]:
+        durations = {}
+        for phase, name, start_ns, end_ns, _, _ in list(self.events):
+            if phase == "X":
+                durations.setdefault(name, []).append(end_ns - start_ns)
+        return {name: np.array(values) / 1e3 for name, values in durations.items()}
+
+    def report(self) -> None:
+        print("Frame trace (microseconds per frame):")
+        for name, durations in self.stage_durations().items():
+            print(f"\t{name:<24} {len(durations):7d} spans, mean {durations.mean():10.1f}, p50 {np.percentile(durations, 50):10.1f}, "
+                  f"p99 {np.percentile(durations, 99):10.1f}, max {durations.max():10.1f}")
+        print(f"\t{self.underruns} FIFO underruns while running")
+
+    def write(self, path: str) -> None:
+        """
+        Chrome trace event format: complete events for spans, counter events for the FIFO levels
+        and one track per thread
+        """
+        pid = os.getpid()
+        trace_events = [{"ph": "M", "name": "thread_name", "pid": pid, "tid": ident, "args": {"name": name}}
+                        for ident, name in list(self.thread_names.items())]
+        for phase, name, start_ns, end_ns, ident, value in list(self.events):
+            event = {"ph": phase, "name": name, "pid": pid, "tid": ident, "ts": (start_ns - self.origin_ns) / 1e3}
+            if phase == "X":
+                event["dur"] = (end_ns - start_ns) / 1e3
+                event["args"] = {"frame": value[0], "loop": value[1]}
+            elif phase == "C":
+                event["args"] = {"items": value}
+            else:
+                event["s"] = "g"
+            trace_events.append(event)
+
+        with open(path, "w") as trace_file:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, trace_file)
+        print(f"Wrote {len(trace_events)} trace events to {path}")
+
+
+class FifoProbe:
+    """
+    FIFO level of one device, recorded as a counter whenever it changes
+    An underrun lasts from a level of 0 sampled while running() holds until the next item is submitted
+    """
+
+    def __init__(self, tracer: FrameTracer, label: str, running: Callable[[], bool]):
+        self.tracer = tracer
+        self.label = label
+        self.running = running
+        self.last_level = None
+        self.underrun_start = None
+
+    def sample(self, fifo_level: int) -> None:
+        if fifo_level != self.last_level:
+            self.last_level = fifo_level
+            self.tracer.counter(self.label, fifo_level)
+        if fifo_level == 0 and self.underrun_start is None and self.running():
+            self.underrun_start = time.perf_counter_ns()
+            self.tracer.underruns += 1
+
+    def item_submitted(self) -> None:
+        if self.underrun_start is not None:
+            self.tracer.span(f"underrun {self.label}", self.underrun_start)
+            self.underrun_start = None
@@ -0,0 +1,43 @@
+import functools
+from typing import *
+
+import numpy as np
+
+from constants import AJParameters
+
+
+class HelixGeometry(NamedTuple):
+    """
+    Rotating helical screen seen by the DMD from below, along the rotation axis
+    Each blade rises through the whole height over 1/blades of a turn, so every DMD pixel sees
+    exactly one point of the surface at any angle. Lengths are in DMD pixels, with the axis at
+    the centre of the frame
+    """
+    blades: int = 1 # e.g. 3 for the 3blade screen
+    height: float = 912.0 # rise of a blade
+    ticks_per_revolution: int = 1600 # frames per revolution, as in calc_frame_time_from_motor_speed
+    rows: int = AJParameters.imageHeight # frame size of the streamed images
+    columns: int = AJParameters.imageWidth
+
+    def radius(self) -> float:
+        return min(self.rows, self.columns) / 2
+
+
+@functools.lru_cache(maxsize=4)
+def pixel_coordinates(geometry: HelixGeometry) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    x, y and polar angle of every pixel centre, each of shape (rows, columns)
+    y points up, so row 0 is the top of the frame
+    """
+    rows, columns = np.mgrid[0:geometry.rows, 0:geometry.columns].astype(np.float32)
+    x = columns + 0.5 - geometry.columns / 2
+    y = geometry.rows / 2 - (rows + 0.5)
+    return x, y, np.arctan2(y, x)
+
+
+def surface_height(geometry: HelixGeometry, theta: np.ndarray, tick: int) -> np.ndarray:
+    """
+    Height of the screen above the polar angles theta when the motor is at tick
+    """
+    turn = (theta / (2 * np.pi) - tick / geometry.ticks_per_revolution) * geometry.blades
+    return (geometry.height * (turn - np.floor(turn))).astype(np.float32)
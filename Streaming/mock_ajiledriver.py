@@ -0,0 +1,450 @@
+"""
+Hardware-free stand-in for the parts of ajiledriver used by this project
+
+The simulated DMD keeps a streaming FIFO with a memory limit, charged per frame at the device
+bit depth of its region like getImageSize, and rejects frames reaching outside the DMD with
+ERROR_OUTOFRANGE. While a sequence runs it consumes each item after frameTime * number of frames
+* repeat count. Consumption is computed 
+lazily from a clock, so passing a MockClock makes the playback and every underrun deterministic
+"""
+
+import time
+import threading
+from collections import deque
+from typing import *
+
+# Error codes
+ERROR_NONE = 0
+ERROR_WARNING = 1
+ERROR_CRITICAL = -1
+ERROR_OUTOFRANGE = -2
+ERROR_CONNECTION = -3
+ERROR_TIMEDOUT = -4
+ERROR_WRONGDEVICE = -5
+ERROR_INVALID = -6
+ERROR_OUT_OF_MEMORY = -7
+ERROR_FILENAME = -8
+ERROR_DATA = -9
+ERROR_STATE = -10
+
+# Run states
+RUN_STATE_PARKED = 1
+RUN_STATE_STOPPED = 2
+RUN_STATE_RUNNING = 3
+RUN_STATE_PAUSED = 4
+
+# Device types
+UNDEFINED_DEVICE_TYPE = 0
+PC_DEVICE_TYPE = 1
+DMD_3000_DEVICE_TYPE = 4
+DMD_4500_DEVICE_TYPE = 5
+AJILE_CONTROLLER_DEVICE_TYPE = 10
+
+# Communication interfaces
+GIGE_INTERFACE_TYPE = 1
+USB2_INTERFACE_TYPE = 2
+USB3_INTERFACE_TYPE = 3
+PCIE_INTERFACE_TYPE = 4
+
+# Images and sequences
+ROW_MAJOR_ORDER = 0
+COLUMN_MAJOR_ORDER = 1
+SEQ_TYPE_PRELOAD = 0
+SEQ_TYPE_STREAM = 1
+
+# the frame size of AJParameters, so the simulated DMD takes the frames the project generates
+DMD_4500_IMAGE_WIDTH_MAX = 1140
+DMD_4500_IMAGE_HEIGHT_MAX = 912
+DMD_3000_IMAGE_WIDTH_MAX = 608
+DMD_3000_IMAGE_HEIGHT_MAX = 684
+CMV4000_BIT_DEPTH = 10
+CMV4000_IMAGE_HEIGHT_MAX = 2048
+
+# Frame times are integer ticks of the 100 MHz device clock
+TICKS_PER_MSEC = 100000
+
+
+def FromMSec(milliseconds: float) -> int:
+    return int(round(milliseconds * TICKS_PER_MSEC))
+
+
+def ToMSec(ticks: int) -> float:
+    return ticks / TICKS_PER_MSEC
+
+
+class MockClock:
+    # Manually advanced clock for deterministic simulations
+    
+    def __init__(self, start: float = 0.0):
+        self.now = start
+    
+    def __call__(self) -> float:
+        return self.now
+    
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+class DeviceType:
+    
+    def __init__(self, hardware_type: int):
+        self.hardware_type = hardware_type
+    
+    def HardwareType(self) -> int:
+        return self.hardware_type
+
+
+class Component:
+    
+    def __init__(self, hardware_type: int, rows: int = 0, columns: int = 0, image_memory_size: int = 0):
+        self.device_type = DeviceType(hardware_type)
+        self.rows = rows
+        self.columns = columns
+        self.image_memory_size = image_memory_size
+    
+    def DeviceType(self) -> DeviceType:
+        return self.device_type
+    
+    def NumRows(self) -> int:
+        return self.rows
+    
+    def NumColumns(self) -> int:
+        return self.columns
+    
+    def ImageMemorySize(self) -> int:
+        return self.image_memory_size
+
+
+class Image:
+    
+    def __init__(self):
+        self.data = None
+        self.bit_depth = 8
+        self.device_type = UNDEFINED_DEVICE_TYPE
+    
+    def ReadFromMemory(self, data: Any, bit_depth: int, major_order: int, device_type: int) -> int:
+        self.data = data
+        self.bit_depth = bit_depth
+        self.device_type = device_type
+        return ERROR_NONE
+    
+    def device_bit_depth(self) -> int:
+        # DMDs hold binary frames, the driver converts deeper images for them
+        return 1 if self.device_type in (DMD_4500_DEVICE_TYPE, DMD_3000_DEVICE_TYPE) else self.bit_depth
+    
+    def Size(self) -> int:
+        return 0 if self.data is None else int(self.data.nbytes)
+
+
+class Frame:
+    
+    def __init__(self, sequence_id: int = 0, image_id: int = 0, frame_time: int = 0, 
+                 roi_first_column: int = 0, roi_first_row: int = 0, roi_width_columns: int = 0, roi_height_rows: int = 0):
+        self.sequence_id = sequence_id
+        self.image_id = image_id
+        self.frame_time = frame_time
+        self.roi_first_column = roi_first_column
+        self.roi_first_row = roi_first_row
+        self.roi_width_columns = roi_width_columns
+        self.roi_height_rows = roi_height_rows
+        self.streaming_image = None
+    
+    def SetStreamingImage(self, image: Image) -> None:
+        self.streaming_image = image
+    
+    def FrameTime(self) -> int:
+        return self.frame_time
+    
+    def SetFrameTime(self, frame_time: int) -> None:
+        self.frame_time = frame_time
+    
+    def RoiFirstColumn(self) -> int:
+        return self.roi_first_column
+    
+    def RoiFirstRow(self) -> int:
+        return self.roi_first_row
+    
+    def RoiWidthColumns(self) -> int:
+        return self.roi_width_columns
+    
+    def RoiHeightRows(self) -> int:
+        return self.roi_height_rows
+    
+    def device_bytes(self) -> int:
+        # device memory of the frame: its region at the device bit depth, whatever padding the host rows had
+        if self.streaming_image is None:
+            return 0
+        return -(-self.roi_height_rows * self.roi_width_columns * self.streaming_image.device_bit_depth() // 8)
+
+
+class SequenceItem:
+    
+    def __init__(self, sequence_id: int = 0, repeat_count: int = 1):
+        self.sequence_id = sequence_id
+        self.repeat_count = repeat_count
+        self.frames = []
+    
+    def AddFrame(self, frame: Frame) -> None:
+        self.frames.append(frame)
+    
+    def Frames(self) -> List[Frame]:
+        return self.frames
+    
+    def RepeatCount(self) -> int:
+        return self.repeat_count
+    
+    def Duration(self) -> float:
+        # seconds the item stays on the DMD
+        ticks = sum(frame.FrameTime() for frame in self.frames) * max(self.repeat_count, 1)
+        return ToMSec(ticks) / 1000
+    
+    def Size(self) -> int:
+        return sum(frame.streaming_image.Size() for frame in self.frames if frame.streaming_image is not None)
+    
+    def device_bytes(self) -> int:
+        return sum(frame.device_bytes() for frame in self.frames)
+
+
+class SequenceItemList(list): ...
+
+
+class Sequence:
+    
+    def __init__(self, sequence_id: int, name: str, hardware_type: int, sequence_type: int, repeat_count: int, 
+                 sequence_items: Optional[SequenceItemList] = None, run_state: int = RUN_STATE_PAUSED):
+        self.sequence_id = sequence_id
+        self.name = name
+        self.hardware_type = hardware_type
+        self.sequence_type = sequence_type
+        self.repeat_count = repeat_count
+        self.sequence_items = SequenceItemList() if sequence_items is None else sequence_items
+        self.run_state = run_state
+    
+    def ID(self) -> int:
+        return self.sequence_id
+    
+    def HardwareType(self) -> int:
+        return self.hardware_type
+    
+    def SequenceItems(self) -> SequenceItemList:
+        return self.sequence_items
+    
+    def Size(self) -> int:
+        return sum(item.Size() for item in self.sequence_items)
+
+
+class SequenceDict(dict):
+    
+    def iteritems(self):
+        return iter(self.items())
+
+
+class Project:
+    
+    def __init__(self, name: str = ""):
+        self.name = name
+        self.components = []
+        self.sequences = SequenceDict()
+    
+    def SetComponents(self, components: List[Component]) -> None:
+        self.components = list(components)
+    
+    def Components(self) -> List[Component]:
+        return self.components
+    
+    def GetComponentIndexWithDeviceType(self, hardware_type: int) -> int:
+        for index, component in enumerate(self.components):
+            if component.DeviceType().HardwareType() == hardware_type:
+                return index
+        return -1
+    
+    def AddSequence(self, sequence: Sequence) -> None:
+        self.sequences[sequence.ID()] = sequence
+    
+    def Sequences(self) -> SequenceDict:
+        return self.sequences
+    
+    def FindSequence(self, sequence_id: int) -> Tuple[Optional[Sequence], bool]:
+        sequence = self.sequences.get(sequence_id)
+        return sequence, sequence is not None
+
+
+class DeviceState:
+    
+    def __init__(self, run_state: int):
+        self.run_state = run_state
+    
+    def RunState(self) -> int:
+        return self.run_state
+
+
+class SimulatedDmd:
+    """
+    Streaming FIFO of one DMD component
+    Items leave the FIFO once their display time has elapsed on the clock. If the FIFO runs dry
+    while the sequence is running, the next item starts when it arrives and counts as an underrun
+    """
+    
+    def __init__(self, component: Component, clock: Callable[[], float], memory_bytes: int):
+        self.component = component
+        self.clock = clock
+        self.memory_bytes = memory_bytes
+        
+        self.fifo = deque()
+        self.fifo_bytes = 0
+        self.run_state = RUN_STATE_STOPPED
+        self.lite_mode = False
+        
+        self.current_item_end = None
+        self.starved = False
+        self.displayed_items = 0
+        self.underrun_count = 0
+        self.submitted_items = 0
+    
+    def update(self) -> None:
+        if self.run_state != RUN_STATE_RUNNING:
+            return
+        
+        now = self.clock()
+        while self.fifo and self.current_item_end <= now:
+            item = self.fifo.popleft()
+            self.fifo_bytes -= item.device_bytes()
+            self.displayed_items += 1
+            # the next item follows immediately, unless the FIFO is now empty
+            self.current_item_end = self.current_item_end + self.fifo[0].Duration() if self.fifo else None
+        
+        if not self.fifo:
+            self.starved = True
+    
+    def add(self, item: SequenceItem) -> int:
+        self.update()
+        for frame in item.Frames():
+            if (frame.RoiFirstColumn() < 0 or frame.RoiFirstRow() < 0 or 
+                frame.RoiFirstColumn() + frame.RoiWidthColumns() > self.component.NumColumns() or 
+                frame.RoiFirstRow() + frame.RoiHeightRows() > self.component.NumRows()):
+                return ERROR_OUTOFRANGE
+        if self.fifo_bytes + item.device_bytes() > self.memory_bytes:
+            return ERROR_OUT_OF_MEMORY
+        
+        if self.run_state == RUN_STATE_RUNNING and not self.fifo:
+            # the DMD ran dry before this item arrived, so it starts late
+            if self.starved:
+                self.underrun_count += 1
+            self.current_item_end = self.clock() + item.Duration()
+        
+        self.fifo.append(item)
+        self.fifo_bytes += item.device_bytes()
+        self.submitted_items += 1
+        self.starved = False
+        return ERROR_NONE
+    
+    def start(self) -> None:
+        self.run_state = RUN_STATE_RUNNING
+        self.current_item_end = self.clock() + self.fifo[0].Duration() if self.fifo else None
+        # an empty FIFO at start is not an underrun
+        self.starved = False
+    
+    def stop(self) -> None:
+        self.run_state = RUN_STATE_STOPPED
+        self.fifo.clear()
+        self.fifo_bytes = 0
+        self.current_item_end = None
+        self.starved = False
+
+
+class Driver:
+    
+    def __init__(self, host_system: "HostSystem"):
+        self.host_system = host_system
+        self.lock = threading.Lock()
+        self.loaded_project = None
+    
+    def _dmd(self, index: int) -> SimulatedDmd:
+        return self.host_system.dmds[index]
+    
+    def StopSequence(self, index: int) -> int:
+        with self.lock:
+            self._dmd(index).stop()
+        return ERROR_NONE
+    
+    def StartSequence(self, sequence_id: int, index: int) -> int:
+        with self.lock:
+            if self.loaded_project is None or sequence_id not in self.loaded_project.Sequences():
+                return ERROR_INVALID
+            self._dmd(index).start()
+        return ERROR_NONE
+    
+    def LoadProject(self, project: Project) -> int:
+        with self.lock:
+            self.loaded_project = project
+        return ERROR_NONE
+    
+    def WaitForLoadComplete(self, timeout: int = -1) -> int:
+        return ERROR_NONE
+    
+    def SetLiteMode(self, enabled: bool, index: int) -> int:
+        with self.lock:
+            self._dmd(index).lite_mode = enabled
+        return ERROR_NONE
+    
+    def GetNumStreamingSequenceItems(self, index: int) -> int:
+        with self.lock:
+            dmd = self._dmd(index)
+            dmd.update()
+            return len(dmd.fifo)
+    
+    def AddStreamingSequenceItem(self, item: SequenceItem, index: int) -> int:
+        with self.lock:
+            return self._dmd(index).add(item)
+    
+    def IsSequenceStatusQueueEmpty(self, index: int) -> bool:
+        return True
+
+
+class HostSystem:
+    """
+    Simulated host with an Ajile controller at component index 0 and one DMD at index 1
+    """
+    
+    def __init__(self, clock: Callable[[], float] = time.perf_counter, dmd_type: int = DMD_4500_DEVICE_TYPE, 
+                 memory_bytes: int = 0x80000000):
+        if dmd_type == DMD_4500_DEVICE_TYPE:
+            rows, columns = DMD_4500_IMAGE_HEIGHT_MAX, DMD_4500_IMAGE_WIDTH_MAX
+        else:
+            rows, columns = DMD_3000_IMAGE_HEIGHT_MAX, DMD_3000_IMAGE_WIDTH_MAX
+        
+        self.project = Project("mock")
+        self.project.SetComponents([
+            Component(AJILE_CONTROLLER_DEVICE_TYPE),
+            Component(dmd_type, rows, columns, memory_bytes),
+        ])
+        self.dmds = {1: SimulatedDmd(self.project.Components()[1], clock, memory_bytes)}
+        self.driver = Driver(self)
+        
+        self.ip_address = None
+        self.usb3_device_number = 0
+        self.communication_interface = USB2_INTERFACE_TYPE
+    
+    def SetConnectionSettingsStr(self, ip_address: str, netmask: str, gateway: str, port: int) -> None:
+        self.ip_address = ip_address
+    
+    def SetUSB3DeviceNumber(self, device_number: int) -> None:
+        self.usb3_device_number = device_number
+    
+    def SetCommunicationInterface(self, communication_interface: int) -> None:
+        self.communication_interface = communication_interface
+    
+    def StartSystem(self) -> int:
+        return ERROR_NONE
+    
+    def GetDriver(self) -> Driver:
+        return self.driver
+    
+    def GetProject(self) -> Project:
+        return self.project
+    
+    def GetDeviceState(self, index: int) -> DeviceState:
+        with self.driver.lock:
+            dmd = self.dmds[index]
+            dmd.update()
+            return DeviceState(dmd.run_state)
@@ -0,0 +1,235 @@
+"""
+Slice STL models along the surface of the helical screen, straight into DMD frames
+
+The mesh is loaded once and fitted into the display volume. A uniform grid over the triangles'
+footprints finds, for every pixel, the heights at which a vertical ray through it crosses the
+mesh. A point is inside the model when an odd number of crossings lie below it, so each frame is
+a single comparison of the crossings against the height of the screen at that tick.
+"""
+
+import os
+from typing import *
+
+import numpy as np
+
+from helix import HelixGeometry, pixel_coordinates, surface_height
+
+STL_RECORD = np.dtype([("normal", "<f4", (3,)), ("vertices", "<f4", (3, 3)), ("attribute", "<u2")])
+
+
+def load_stl(path: str) -> np.ndarray:
+    """
+    Triangles of a binary or ASCII STL file, shape (count, 3 vertices, xyz)
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as stl_file:
+        header = stl_file.read(84)
+        if len(header) == 84:
+            count = int(np.frombuffer(header, dtype="<u4", offset=80)[0])
+            if size == 84 + count * STL_RECORD.itemsize:
+                return np.fromfile(stl_file, dtype=STL_RECORD, count=count)["vertices"].astype(np.float64)
+
+    # ASCII: every 'vertex x y z' line, three per facet
+    with open(path, "r", errors="replace") as stl_file:
+        vertices = [line.split()[1:4] for line in stl_file if line.lstrip().startswith("vertex")]
+    if len(vertices) == 0 or len(vertices) % 3 != 0:
+        raise ValueError(f"{path} is not a valid STL file")
+    return np.array(vertices, dtype=np.float64).reshape(-1, 3, 3)
+
+
+def fit_to_volume(triangles: np.ndarray, geometry: HelixGeometry, margin: float = 0.98) -> np.ndarray:
+    """
+    Centre the mesh on the rotation axis and scale it uniformly to fit inside the screen's cylinder
+    """
+    points = triangles.reshape(-1, 3)
+    low = points.min(axis=0)
+    high = points.max(axis=0)
+    centre = np.array([(low[0] + high[0]) / 2, (low[1] + high[1]) / 2, low[2]])
+
+    centred = points - centre
+    radial_extent = np.sqrt(centred[:, 0]**2 + centred[:, 1]**2).max()
+    z_extent = high[2] - low[2]
+    scale = margin * min(geometry.radius() / max(radial_extent, 1e-12), geometry.height / max(z_extent, 1e-12))
+
+    return (centred * scale).reshape(triangles.shape)
+
+
+class TriangleGrid:
+    """
+    Uniform grid spatial index over the xy footprint of the triangles
+    Every cell lists the triangles whose bounding box overlaps it, in CSR form
+    """
+
+    def __init__(self, triangles: np.ndarray, origin: Tuple[float, float], cell_size: float, shape: Tuple[int, int]):
+        self.origin = np.asarray(origin, dtype=np.float64)
+        self.cell_size = cell_size
+        self.shape = shape # (cells along y, cells along x)
+
+        low = np.floor((triangles[:, :, :2].min(axis=1) - self.origin) / cell_size).astype(np.int64)
+        high = np.floor((triangles[:, :, :2].max(axis=1) - self.origin) / cell_size).astype(np.int64)
+        low = np.clip(low, 0, [shape[1] - 1, shape[0] - 1])
+        high = np.clip(high, 0, [shape[1] - 1, shape[0] - 1])
+
+        # expand every triangle to all the cells of its bounding box without a python loop
+        widths = high[:, 0] - low[:, 0] + 1
+        counts = widths * (high[:, 1] - low[:, 1] + 1)
+        triangle_ids = np.repeat(np.arange(len(triangles)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cell_x = low[triangle_ids, 0] + local % widths[triangle_ids]
+        cell_y = low[triangle_ids, 1] + local // widths[triangle_ids]
+        cells = cell_y * shape[1] + cell_x
+
+        order = np.argsort(cells, kind="stable")
+        self.triangle_ids = triangle_ids[order]
+        self.cell_starts = np.concatenate(([0], np.cumsum(np.bincount(cells, minlength=shape[0] * shape[1]))))
+
+    def cell_triangles(self, cell: int) -> np.ndarray:
+        return self.triangle_ids[self.cell_starts[cell]:self.cell_starts[cell + 1]]
+
+    def occupied_cells(self) -> np.ndarray:
+        return np.flatnonzero(np.diff(self.cell_starts))
+
+
+def edge_side(p: np.ndarray, q: np.ndarray, opposite: np.ndarray, px: np.ndarray, py: np.ndarray) -> np.ndarray:
+    """
+    Whether each point lies on the same side of the xy edge p-q as the opposite vertex
+    Points exactly on the edge belong to the side the direction (1, epsilon) points to, so an edge
+    shared by two triangles is counted for exactly one of them. The endpoints are put in a fixed
+    order first, which makes the edge function bit-identical in both triangles
+    """
+    swap = (p[:, 0] > q[:, 0]) | ((p[:, 0] == q[:, 0]) & (p[:, 1] > q[:, 1]))
+    p, q = np.where(swap[:, None], q, p), np.where(swap[:, None], p, q)
+    dx = q[:, 0] - p[:, 0]
+    dy = q[:, 1] - p[:, 1]
+
+    side = np.sign(dx * (opposite[:, 1] - p[:, 1]) - dy * (opposite[:, 0] - p[:, 0]))
+    edge = (dx * (py - p[:, 1]) - dy * (px - p[:, 0])) * side
+    # derivative of the signed edge function along x, then along y
+    tie = (-dy * side > 0) | ((dy == 0) & (dx * side > 0))
+    return (edge > 0) | ((edge == 0) & tie)
+
+
+def vertical_crossings(triangles: np.ndarray, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """
+    Height at which the vertical line through each point crosses each triangle, inf where it misses
+    Shape (points, triangles). Triangles seen edge-on from above never count as crossings, and a line
+    through an edge or vertex shared by several triangles crosses only one of them
+    """
+    a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    area = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (c[:, 0] - a[:, 0]) * (b[:, 1] - a[:, 1])
+    valid = np.abs(area) > 1e-12
+    area = np.where(valid, area, 1.0)
+
+    px = x[:, None]
+    py = y[:, None]
+    # barycentric weights of b and c
+    wb = ((px - a[:, 0]) * (c[:, 1] - a[:, 1]) - (c[:, 0] - a[:, 0]) * (py - a[:, 1])) / area
+    wc = ((b[:, 0] - a[:, 0]) * (py - a[:, 1]) - (px - a[:, 0]) * (b[:, 1] - a[:, 1])) / area
+    wa = 1 - wb - wc
+
+    hit = valid & edge_side(a, b, c, px, py) & edge_side(b, c, a, px, py) & edge_side(c, a, b, px, py)
+    z = wa * a[:, 2] + wb * b[:, 2] + wc * c[:, 2]
+    return np.where(hit, z, np.inf)
+
+
+class StlHelixSlicer:
+    """
+    Generates the binary frame of every motor tick for an STL model
+    The crossing table is built once per model and geometry; frames() then only compares it
+    against the screen height of each tick, for the pixels under the model
+    """
+
+    def __init__(self, triangles: np.ndarray, geometry: HelixGeometry = HelixGeometry(), cell_pixels: int = 16, fit: bool = True):
+        self.geometry = geometry
+        triangles = fit_to_volume(triangles, geometry) if fit else np.asarray(triangles, dtype=np.float64)
+
+        x, y, theta = pixel_coordinates(geometry)
+        grid_shape = (-(-geometry.rows // cell_pixels), -(-geometry.columns // cell_pixels))
+        # cell (0, 0) holds the bottom-left pixels, x and y grow with the cell indices
+        origin = (-geometry.columns / 2, -geometry.rows / 2)
+        grid = TriangleGrid(triangles, origin, cell_pixels, grid_shape)
+
+        footprint = []
+        crossings = []
+        flat_x = x.ravel()
+        flat_y = y.ravel()
+        columns = np.arange(geometry.columns)
+        for cell in grid.occupied_cells():
+            cell_y, cell_x = divmod(int(cell), grid_shape[1])
+            # bottom-left cells are the last rows of the frame
+            row_stop = geometry.rows - cell_y * cell_pixels
+            rows = np.arange(max(row_stop - cell_pixels, 0), row_stop)
+            pixels = (rows[:, None] * geometry.columns + columns[cell_x * cell_pixels:(cell_x + 1) * cell_pixels]).ravel()
+
+            heights = np.sort(vertical_crossings(triangles[grid.cell_triangles(cell)], flat_x[pixels], flat_y[pixels]), axis=1)
+            # keep only as many columns as the most crossed pixel of the cell needs
+            depth = int(np.isfinite(heights).sum(axis=1).max())
+            if depth == 0:
+                continue
+            crossed = np.isfinite(heights[:, 0])
+            footprint.append(pixels[crossed])
+            crossings.append(heights[crossed, :depth])
+
+        depth = max((heights.shape[1] for heights in crossings), default=1)
+        self.footprint = np.concatenate(footprint) if footprint else np.empty(0, dtype=np.int64)
+        self.crossings = np.full((len(self.footprint), depth), np.inf, dtype=np.float32)
+        start = 0
+        for heights in crossings:
+            self.crossings[start:start + len(heights), :heights.shape[1]] = heights
+            start += len(heights)
+        self.theta = theta.ravel()[self.footprint]
+
+    @classmethod
+    def from_file(cls, path: str, geometry: HelixGeometry = HelixGeometry(), **kwargs: Any) -> "StlHelixSlicer":
+        return cls(load_stl(path), geometry, **kwargs)
+
+    def slice(self, tick: int) -> np.ndarray:
+        """
+        Boolean (rows, columns) frame, True where the screen is inside the model at tick
+        """
+        heights = surface_height(self.geometry, self.theta, tick)
+        inside = np.count_nonzero(self.crossings < heights[:, None], axis=1) % 2 == 1
+
+        frame = np.zeros(self.geometry.rows * self.geometry.columns, dtype=bool)
+        frame[self.footprint] = inside
+        return frame.reshape(self.geometry.rows, self.geometry.columns)
+
+    def frames(self, start_tick: int = 0, count: Optional[int] = None) -> Iterator[np.ndarray]:
+        # one revolution by default
+        count = self.geometry.ticks_per_revolution if count is None else count
+        for tick in range(start_tick, start_tick + count):
+            yield self.slice(tick)
+
+
+def cube_triangles() -> np.ndarray:
+    # closed unit cube, two triangles per face split along a diagonal
+    corners = np.array([[x, y, z] for z in (0, 1) for y in (0, 1) for x in (0, 1)], dtype=np.float64)
+    faces = [(0, 2, 3, 1), (4, 5, 7, 6), (0, 1, 5, 4), (2, 6, 7, 3), (0, 4, 6, 2), (1, 3, 7, 5)]
+    return np.array([[corners[i], corners[j], corners[k]] for a, b, c, d in faces for i, j, k in ((a, b, c), (a, c, d))])
+
+
+def check_cube(ticks: Iterable[int] = (0, 100, 800), geometry: HelixGeometry = HelixGeometry()) -> int:
+    """
+    Regression check of the slicer against the analytic inside test of a cube
+    The fitted cube's seams run through pixel centres, so shared edges must not flip the parity.
+    Returns the number of wrong pixels, ignoring pixels on the faces themselves
+    """
+    triangles = fit_to_volume(cube_triangles(), geometry)
+    slicer = StlHelixSlicer(triangles, geometry, fit=False)
+    half_width = triangles[..., 0].max()
+    top = triangles[..., 2].max()
+
+    x, y, theta = pixel_coordinates(geometry)
+    wrong = 0
+    for tick in ticks:
+        z = surface_height(geometry, theta, tick)
+        expected = (np.abs(x) < half_width) & (np.abs(y) < half_width) & (z > 0) & (z < top)
+        on_face = np.isclose(np.abs(x), half_width) | np.isclose(np.abs(y), half_width) | np.isclose(z, 0) | np.isclose(z, top)
+        mismatches = int(np.count_nonzero((slicer.slice(tick) != expected) & ~on_face))
+        print(f"tick {tick}: {mismatches} wrong pixels")
+        wrong += mismatches
+    return wrong
+
+
+if __name__ == "__main__":
+    raise SystemExit(1 if check_cube() else 0)
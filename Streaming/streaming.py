@@ -1,51 +1,250 @@
 # Native modules
-import cv2
+import time
+LAUNCH_TIME = time.perf_counter()
 import os
 import asyncio
 import numpy as np
-import time
+import threading
+import functools
+import itertools
 from typing import *
 from collections import deque
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
-# Third-party modules
-import ajiledriver as aj
+# Third-party modules, cv2 and the driver are imported on first use
+from driver_backend import aj
 
 # Project modules
 from utilities import *
 from constants import *
+from frame_cache import *
+from device_watcher import DeviceStateWatcher
+from frame_timing import FrameTimingEngine, follow_hall_sensor
+from frame_archive import FrameArchive
+from frame_trace import FrameTracer
+from helix import HelixGeometry
+from stl_slicer import StlHelixSlicer
+from voxel_slicer import VoxelHelixSlicer
 
 MESSAGE_QUEUE = GaugedQueue()
 
-# Set-up parameters
-PARAMS = get_command_arguments()
+# Set-up parameters, the defaults until main() or configure() installs the parsed ones
+PARAMS = AJParameters()
+
+# Per-frame tracing, only set up when TRACE_FILE is given
+TRACER: Optional[FrameTracer] = None
+
+
+def configure(parameters: AJParameters) -> None:
+    global PARAMS
+    PARAMS = parameters
+
+def column_scale() -> int:
+    # pixels per stored column: packed binary and bitplane frames hold 8 per byte
+    return 8 if PARAMS.FRAME_BIT_DEPTH == 1 or PARAMS.GRAYSCALE_BITPLANES else 1
+
+
+def pixel_width(stored_columns: int) -> int:
+    # width in pixels of a frame stored with stored_columns columns, the last byte of a packed row may be padding
+    scale = column_scale()
+    if scale > 1 and stored_columns == -(-PARAMS.imageWidth // scale):
+        return PARAMS.imageWidth
+    return stored_columns * scale
+
+
+class RegionOfInterest(NamedTuple):
+    # Bounding box in DMD pixels
+    first_row: int
+    first_column: int
+    num_rows: int
+    num_columns: int
+
+
+def find_region_of_interest(images: Iterable[np.ndarray]) -> Optional[RegionOfInterest]:
+    """
+    Union of the non-zero bounding boxes over a whole volume, None if every image is blank
+    Each image is reduced to row and column occupancy masks with numpy, which are OR-ed together.
+    Packed 1-bit images have byte granular columns, which keeps the crop aligned to whole bytes
+    """
+    row_mask = None
+    column_mask = None
+    width = 0
+    
+    for np_image in images:
+        width = pixel_width(np_image.shape[1])
+        occupied = np_image.any(axis=2)
+        rows = occupied.any(axis=1)
+        columns = occupied.any(axis=0)
+        row_mask = rows if row_mask is None else row_mask | rows
+        column_mask = columns if column_mask is None else column_mask | columns
+    
+    if row_mask is None or not row_mask.any():
+        return None
+    
+    row_indices = np.flatnonzero(row_mask)
+    column_indices = np.flatnonzero(column_mask)
+    first_column = int(column_indices[0]) * column_scale()
+    
+    return RegionOfInterest(
+        first_row=int(row_indices[0]), 
+        first_column=first_column, 
+        num_rows=int(row_indices[-1] - row_indices[0] + 1), 
+        # the padding bits of the last packed byte are not part of the frame
+        num_columns=min(int(column_indices[-1] + 1) * column_scale(), width) - first_column
+    )
+
+
+def crop_to_region_of_interest(np_image: np.ndarray, roi: RegionOfInterest) -> np.ndarray:
+    first_column = roi.first_column // column_scale()
+    num_columns = -(-roi.num_columns // column_scale())
+    
+    # the driver reads the buffer directly, so the cropped view has to be made contiguous
+    return np.ascontiguousarray(np_image[roi.first_row:roi.first_row + roi.num_rows, first_column:first_column + num_columns])
+
+
+def binarize_and_pack(images: np.ndarray, threshold: Optional[int] = None) -> np.ndarray:
+    """
+    Threshold greyscale images and pack 8 pixels per byte along each row
+    Works on a single (rows, columns) image or a whole (count, rows, columns) batch.
+    The most significant bit is the left-most pixel, so packed rows follow aj.ROW_MAJOR_ORDER.
+    Rows whose width is not a multiple of 8 end with zero padding bits, see pixel_width
+    """
+    threshold = PARAMS.BINARY_THRESHOLD if threshold is None else threshold
+    return np.packbits(images > threshold, axis=-1)
+
+
+def decompose_bitplanes(images: np.ndarray) -> np.ndarray:
+    """
+    Split greyscale images into their 8 bitplanes, each packed 8 pixels per byte along the rows
+    Works on a single (rows, columns) image or a whole (count, rows, columns) batch and returns
+    (..., rows, ceil(columns / 8), 8), least significant plane first like DMDGrayscaleFrameTime.
+    Rows are zero padded to whole bytes like binarize_and_pack
+    """
+    planes = (images[..., None] >> np.arange(8, dtype=np.uint8)) & 1
+    return np.packbits(planes, axis=-2)
+
+
+def format_frame(frame: np.ndarray) -> np.ndarray:
+    # boolean or greyscale (rows, columns) frame in the layout read_and_shrink_image produces
+    if PARAMS.GRAYSCALE_BITPLANES:
+        return decompose_bitplanes(frame.astype(np.uint8) * 255 if frame.dtype == bool else frame)
+    if frame.dtype == bool:
+        frame = np.packbits(frame, axis=-1) if PARAMS.FRAME_BIT_DEPTH == 1 else frame.astype(np.uint8) * 255
+    elif PARAMS.FRAME_BIT_DEPTH == 1:
+        frame = binarize_and_pack(frame)
+    return frame.reshape(frame.shape[0], frame.shape[1], 1)
 
-def find_region_of_interest(): ... # Unimplemented
 
 def read_and_shrink_image(path_to_file: str) -> np.ndarray:
     """
     Load and process the image here
-    This function will be executed in parallel later in the asynchronous call
+    This function is executed in parallel by decode_images
     """
+    import cv2
+    
     # Read image in greyscale
     cv_image = cv2.imread(path_to_file, cv2.IMREAD_GRAYSCALE)
     
-    # Convert to binary image
-    # _, cv_image = cv2.threshold(cv_image, 127, 1, cv2.THRESH_BINARY) # This line causing problem
+    # Keep every grey level as 8 binary planes, shown with binary-weighted frame times
+    if PARAMS.GRAYSCALE_BITPLANES:
+        return decompose_bitplanes(cv_image)
+    
+    # Convert to a 1-bit packed binary image, the format DMD_4500/DMD_3000 actually display
+    if PARAMS.FRAME_BIT_DEPTH == 1:
+        cv_image = binarize_and_pack(cv_image)
+    
     required_shape = (cv_image.shape[0], cv_image.shape[1], 1)
-    np_image = np.reshape(cv_image, newshape=required_shape)
+    np_image = np.reshape(cv_image, required_shape)
     
     return np_image 
 
 
-def prepare_streaming_sequence_item(np_image: np.array) -> Any:
+def traced_read_and_shrink_image(index: int, path_to_file: str) -> np.ndarray:
+    start = time.perf_counter_ns()
+    np_image = read_and_shrink_image(path_to_file)
+    TRACER.span("decode", start, index, loop=TRACER.loop)
+    return np_image
+
+
+def collapse_redundant_frames(images: Iterable[np.ndarray], drop_blank: Optional[bool] = None, indices: Optional[Iterable[int]] = None) -> Iterator[Tuple[int, np.ndarray, int]]:
+    """
+    Collapse runs of identical consecutive frames into (first frame index, image, repeat count) runs
+    Every run costs a single transfer; with drop_blank, all-black runs are not sent at all,
+    which is only correct when the projection does not need to stay locked to the motor phase.
+    indices are the source frame indices of the images, their position by default
+    """
+    drop_blank = PARAMS.DROP_BLANK_FRAMES if drop_blank is None else drop_blank
+    indices = itertools.count() if indices is None else indices
+    frame_count = 0
+    transfer_count = 0
+    saved_bytes = 0
+    
+    run_image = None
+    run_first = -1
+    run_length = 0
+    
+    for index, np_image in zip(indices, images):
+        frame_count += 1
+        if run_image is not None and np.array_equal(np_image, run_image):
+            run_length += 1
+            continue
+        
+        if run_image is not None:
+            saved_bytes += (run_length - 1) * run_image.nbytes
+            if drop_blank and not run_image.any():
+                saved_bytes += run_image.nbytes
+            else:
+                transfer_count += 1
+                yield run_first, run_image, run_length
+        
+        run_image = np_image
+        run_first = index
+        run_length = 1
+    
+    if run_image is not None:
+        saved_bytes += (run_length - 1) * run_image.nbytes
+        if drop_blank and not run_image.any():
+            saved_bytes += run_image.nbytes
+        else:
+            transfer_count += 1
+            yield run_first, run_image, run_length
+    
+    print(f"Redundant frames removed: {frame_count} frames sent in {transfer_count} transfers, "
+          f"saved {frame_count - transfer_count} transfers and {saved_bytes / 2**20:.1f} MB")
+
+
+def frame_runs(images: Iterable[np.ndarray], dedup: Optional[bool] = None, indices: Optional[Iterable[int]] = None) -> Iterator[Tuple[int, np.ndarray, int]]:
+    # (first frame index, image, repeat count) runs of a volume, one per frame unless redundant frames are collapsed
+    dedup = PARAMS.DEDUP_FRAMES if dedup is None else dedup
+    indices = itertools.count() if indices is None else indices
+    if dedup:
+        return collapse_redundant_frames(images, indices=indices)
+    return ((index, img, 1) for index, img in zip(indices, images))
+
+
+@functools.lru_cache(maxsize=None)
+def frame_time_ticks(frame_time_ms: float) -> int:
+    # every frame of a sequence has the same time, convert it once
+    return aj.FromMSec(frame_time_ms)
+
+
+def prepare_streaming_sequence_item(np_image: np.array, roi: Optional[RegionOfInterest] = None, repeat_count: int = 1) -> Any:
+
+    if roi is None:
+        # the whole frame, as large as the image actually is
+        roi = RegionOfInterest(0, 0, np_image.shape[0], pixel_width(np_image.shape[1]))
+    else:
+        np_image = crop_to_region_of_interest(np_image, roi)
+    
+    if PARAMS.GRAYSCALE_BITPLANES:
+        return prepare_bitplane_sequence_item(np_image, roi, repeat_count)
 
     streamingImage = aj.Image()
     
-    streamingImage.ReadFromMemory(np_image, 8, aj.ROW_MAJOR_ORDER, PARAMS.deviceType)
+    streamingImage.ReadFromMemory(np_image, PARAMS.FRAME_BIT_DEPTH, aj.ROW_MAJOR_ORDER, PARAMS.deviceType)
     # create a new sequence item and frame to be streamed
-    streamingSeqItem = aj.SequenceItem(PARAMS.sequenceID, 1)
-    streamingFrame = aj.Frame(PARAMS.sequenceID, 0, aj.FromMSec(PARAMS.frameTime_ms), 0, 0, PARAMS.imageWidth, PARAMS.imageHeight)
+    streamingSeqItem = aj.SequenceItem(PARAMS.sequenceID, repeat_count)
+    streamingFrame = aj.Frame(PARAMS.sequenceID, 0, frame_time_ticks(PARAMS.frameTime_ms), roi.first_column, roi.first_row, roi.num_columns, roi.num_rows)
     # attach the next streaming image to the streaming frame
     streamingFrame.SetStreamingImage(streamingImage)
     # add the frame to the streaming sequence item
@@ -54,63 +253,272 @@ def prepare_streaming_sequence_item(np_image: np.array) -> Any:
     return streamingSeqItem
 
 
-def load_images_with_message_queue(stack_count: int = PARAMS.STACK_COUNT, image_directory: str = IMAGE_FOLDER_NAME) -> None:
+def traced_prepare_item(frame: int, np_image: np.ndarray, roi: Optional[RegionOfInterest], repeat_count: int, loop: int = 0) -> Any:
+    # frame is the first source frame of the item, which follows it through the queues and the feeder
+    if TRACER is None:
+        return prepare_streaming_sequence_item(np_image, roi, repeat_count)
+    start = time.perf_counter_ns()
+    item = prepare_streaming_sequence_item(np_image, roi, repeat_count)
+    TRACER.span("prepare", start, frame, loop=loop)
+    TRACER.tag(item, frame)
+    return item
+
+
+def prepare_bitplane_sequence_item(planes: np.ndarray, roi: RegionOfInterest, repeat_count: int = 1) -> Any:
+    """
+    One sequence item with a 1-bit frame per bitplane of a (rows, ceil(columns / 8), 8) image
+    The planes share the frame time with binary weights, so the exposure of every pixel is
+    proportional to its grey level
+    """
+    streamingSeqItem = aj.SequenceItem(PARAMS.sequenceID, repeat_count)
+    plane_ticks = split_slice_time(frame_time_ticks(PARAMS.frameTime_ms))
+    for plane in range(planes.shape[2]):
+        streamingImage = aj.Image()
+        streamingImage.ReadFromMemory(np.ascontiguousarray(planes[:, :, plane:plane + 1]), 1, aj.ROW_MAJOR_ORDER, PARAMS.deviceType)
+        streamingFrame = aj.Frame(PARAMS.sequenceID, 0, plane_ticks[plane], roi.first_column, roi.first_row, roi.num_columns, roi.num_rows)
+        streamingFrame.SetStreamingImage(streamingImage)
+        streamingSeqItem.AddFrame(streamingFrame)
+    
+    return streamingSeqItem
+
+
+def build_sequence_item_pool(runs: Iterable[Tuple[int, np.ndarray, int]], roi: Optional[RegionOfInterest] = None, num_workers: Optional[int] = None) -> List[Any]:
+    """
+    Prepare the sequence items of a whole volume ahead of time with a thread pool
+    The items are built once and replayed on every loop, so the feeder only submits them
+    """
+    num_workers = PARAMS.NUM_WORKERS if num_workers is None else num_workers
+    num_workers = num_workers if num_workers > 0 else (os.cpu_count() or 1)
+    
+    def prepare_chunk(chunk: List[Tuple[int, np.ndarray, int]]) -> List[Any]:
+        return [traced_prepare_item(frame, img, roi, repeat_count) for frame, img, repeat_count in chunk]
+    
+    start = time.perf_counter()
+    runs = list(runs)
+    # a few contiguous chunks per worker keep the executor overhead off each item and the order intact
+    chunk_size = max(1, -(-len(runs) // (4 * num_workers)))
+    chunks = [runs[i:i + chunk_size] for i in range(0, len(runs), chunk_size)]
+    if num_workers == 1:
+        items = prepare_chunk(runs)
+    else:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            items = [item for chunk in executor.map(prepare_chunk, chunks) for item in chunk]
+    
+    elapsed = time.perf_counter() - start
+    print(f"Built {len(items)} sequence items with {num_workers} threads in {elapsed:.3f}s: "
+          f"{elapsed / max(len(items), 1) * 1e6:.1f} us per item")
+    return items
+
+
+def list_image_files(image_directory: str = IMAGE_FOLDER_NAME) -> List[str]:
     """
-    synchronous IO to load images and append them in a deque
+    Collect every file below image_directory, sorted so the slice order does not depend on os.walk
     """
     if not os.path.exists(image_directory):
         raise FileNotFoundError(f"Project Aborted: Unable to find target folder {image_directory}")
     
+    paths = []
     for dirpath, _, files in os.walk(image_directory):
+        paths.extend(os.path.join(dirpath, filename) for filename in files)
+    
+    return sorted(paths)
+
+
+def decode_images(paths: List[str], num_workers: Optional[int] = None, use_processes: Optional[bool] = None) -> Iterator[np.ndarray]:
+    """
+    Decode images in parallel and yield them in the same order as paths
+    cv2.imread releases the GIL, so a thread pool already scales with cores; 
+    a process pool can be selected when the preprocessing becomes python-heavy.
+    At most 2 * num_workers images are in flight, so memory stays bounded if the consumer is slow.
+    Decodes are traced on their worker threads; worker processes do not share the tracer
+    """
+    num_workers = PARAMS.NUM_WORKERS if num_workers is None else num_workers
+    num_workers = num_workers if num_workers > 0 else (os.cpu_count() or 1)
+    use_processes = PARAMS.USE_PROCESSES if use_processes is None else use_processes
+    # worker processes start with the default parameters, hand them the current ones
+    executor_options = {"initializer": configure, "initargs": (PARAMS,)} if use_processes else {}
+    executor_type = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    
+    decoded_count = 0
+    decoded_bytes = 0
+    start = time.perf_counter()
+    
+    traced = TRACER is not None and not use_processes
+    
+    with executor_type(max_workers=num_workers, **executor_options) as executor:
+        pending = deque()
+        for index, path_to_file in enumerate(paths):
+            if traced:
+                pending.append(executor.submit(traced_read_and_shrink_image, index, path_to_file))
+            else:
+                pending.append(executor.submit(read_and_shrink_image, path_to_file))
+            if len(pending) >= 2 * num_workers:
+                np_image = pending.popleft().result()
+                decoded_count += 1
+                decoded_bytes += np_image.nbytes
+                yield np_image
         
-            for filename in files:
-                path_to_file = os.path.join(dirpath, filename)
-                img = read_and_shrink_image(path_to_file)
-                seqItem = prepare_streaming_sequence_item(img)
-                MESSAGE_QUEUE.put(seqItem)  
-                
-    
-    for _ in range(stack_count): MESSAGE_QUEUE.extend(MESSAGE_QUEUE)
-            
-    print(f"Images are ready to send. Number of items: {len(MESSAGE_QUEUE)}")
+        while pending:
+            np_image = pending.popleft().result()
+            decoded_count += 1
+            decoded_bytes += np_image.nbytes
+            yield np_image
+    
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    print(f"Decoded {decoded_count} images with {num_workers} {'processes' if use_processes else 'threads'} in {elapsed:.3f}s: "
+          f"{decoded_count / elapsed:.1f} fps, {decoded_bytes / elapsed / 2**20:.1f} MB/s")
 
 
-async def load_images(image_directory: str = IMAGE_FOLDER_NAME) -> Deque[np.ndarray]:
+def load_volume(paths: List[str], image_directory: str = IMAGE_FOLDER_NAME, num_workers: Optional[int] = None) -> Iterable[np.ndarray]:
     """
-    Async IO to load images and return them in a deque
-    TODO: This can be removed as it is testified that python does not implement true multithreading due to GIL
+    Preprocessed frames of a volume, memory-mapped from the frame cache when it is still valid
+    On a cache miss the images are decoded and written to the cache as they are consumed
     """
-    loop = asyncio.get_running_loop()
-    tasks = []
+    if not PARAMS.USE_CACHE:
+        return decode_images(paths, num_workers)
     
-    if not os.path.exists(image_directory):
-        raise FileNotFoundError(f"Project Aborted: Unable to find target folder {image_directory}")
+    settings = {"frame_bit_depth": PARAMS.FRAME_BIT_DEPTH, "binary_threshold": PARAMS.BINARY_THRESHOLD, "grayscale_bitplanes": PARAMS.GRAYSCALE_BITPLANES}
+    key = volume_cache_key(paths, settings)
+    
+    volume = open_cached_volume(image_directory, key)
+    if volume is not None:
+        print(f"Loaded {len(volume)} preprocessed frames from the frame cache")
+        return volume
+    
+    return write_cached_volume(image_directory, key, decode_images(paths, num_workers), len(paths))
+
+
+def helix_geometry() -> HelixGeometry:
+    return HelixGeometry(PARAMS.HELIX_BLADES, PARAMS.HELIX_HEIGHT, PARAMS.TICKS_PER_REVOLUTION, PARAMS.imageHeight, PARAMS.imageWidth)
+
+
+def open_frame_source(image_directory: str = IMAGE_FOLDER_NAME, num_workers: Optional[int] = None) -> Callable[..., Iterable[np.ndarray]]:
+    # with tracing, the wait for every frame of a pass is recorded as a load span of the playback loop it is called with
+    load_frames = open_untraced_frame_source(image_directory, num_workers)
+    if TRACER is None:
+        return lambda loop=0: load_frames()
+    return lambda loop=0: TRACER.traced_frames(load_frames(), loop=loop)
+
+
+def open_untraced_frame_source(image_directory: str = IMAGE_FOLDER_NAME, num_workers: Optional[int] = None) -> Callable[[], Iterable[np.ndarray]]:
+    """
+    Function returning the frames of the volume, one full pass per call
+    With STL_FILE or VOLUME_FILE the model or voxel volume is sliced along the helix straight into
+    frames, one per tick of a revolution, and nothing is read from the image folder.
+    With ARCHIVE_FILE the preprocessed frames are read from the memory-mapped archive
+    """
+    if PARAMS.ARCHIVE_FILE is not None:
+        archive = FrameArchive(PARAMS.ARCHIVE_FILE)
+        settings = (archive.metadata.get("frame_bit_depth"), archive.metadata.get("grayscale_bitplanes"))
+        if settings != (PARAMS.FRAME_BIT_DEPTH, PARAMS.GRAYSCALE_BITPLANES):
+            raise ValueError(f"{PARAMS.ARCHIVE_FILE} holds frames made with frame bit depth {settings[0]} and bitplanes {settings[1]}, "
+                             f"not {PARAMS.FRAME_BIT_DEPTH} and {PARAMS.GRAYSCALE_BITPLANES}")
+        print(f"Reading {len(archive)} frames from {PARAMS.ARCHIVE_FILE} ({archive.stored_bytes() / 2**20:.1f} MB stored)")
+        return lambda: iter(archive)
+    
+    if PARAMS.STL_FILE is not None or PARAMS.VOLUME_FILE is not None:
+        start = time.perf_counter()
+        if PARAMS.STL_FILE is not None:
+            slicer = StlHelixSlicer.from_file(PARAMS.STL_FILE, helix_geometry())
+        else:
+            slicer = VoxelHelixSlicer.from_file(PARAMS.VOLUME_FILE, helix_geometry())
+        print(f"Prepared {PARAMS.STL_FILE or PARAMS.VOLUME_FILE} for slicing in {time.perf_counter() - start:.3f}s")
+        return lambda: (format_frame(frame) for frame in slicer.frames())
     
+    paths = list_image_files(image_directory)
+    return lambda: load_volume(paths, image_directory, num_workers)
 
-    with ThreadPoolExecutor() as executor:
-        for dirpath, _, files in os.walk(image_directory):
-            for filename in files:
-                path_to_file = os.path.join(dirpath, filename)
-                task = loop.run_in_executor(executor, read_and_shrink_image, path_to_file)
-                tasks.append(task)
-                
-        np_images = await asyncio.gather(*tasks)
+
+def load_images_with_message_queue(image_directory: str = IMAGE_FOLDER_NAME, num_workers: Optional[int] = None) -> None:
+    """
+    Decode images with a worker pool and append the prepared sequence items in a deque
+    Each item is prepared once by build_sequence_item_pool, repeated playback goes through CyclicPlaylist
+    """
+    images = open_frame_source(image_directory, num_workers)()
+    roi = None
+    if PARAMS.AUTO_ROI:
+        # the bounding box needs the whole volume, so keep the decoded images around for the crop
+        images = list(images)
+        roi = find_region_of_interest(images)
+        print(f"Region of interest: {roi}")
+    
+    MESSAGE_QUEUE.extend(build_sequence_item_pool(frame_runs(images), roi, num_workers))
+            
+    print(f"Images are ready to send. Number of items: {len(MESSAGE_QUEUE)}")
+
+    
+def stream_images_into_queue(message_queue: BoundedGaugedQueue, playback_loops: Optional[int] = None, image_directory: str = IMAGE_FOLDER_NAME, num_workers: Optional[int] = None, 
+                             dedup: Optional[bool] = None) -> None:
+    """
+    Producer side of the streaming mode: decode and prepare items into a bounded queue
+    put blocks at the high-water mark, so only that many items are ever held in memory.
+    The volume is loaded again for each loop, forever when playback_loops is 0, unless
+    RECYCLE_ITEMS keeps the items of the first loop and submits them again.
+    Full frames are streamed unless STREAM_AUTO_ROI is set as well as AUTO_ROI: the region of
+    interest needs an extra pass over the whole volume before the first item, which would make
+    the start time grow with the volume again
+    """
+    playback_loops = PARAMS.PLAYBACK_LOOPS if playback_loops is None else playback_loops
+    dedup = PARAMS.DEDUP_FRAMES if dedup is None else dedup
+    try:
+        load_frames = open_frame_source(image_directory, num_workers)
+        
+        roi = None
+        if PARAMS.AUTO_ROI and PARAMS.STREAM_AUTO_ROI:
+            # traced as loop -1, ahead of the playback loops
+            roi = find_region_of_interest(load_frames(-1))
+            print(f"Region of interest: {roi}")
         
-    return deque(np_images)
+        recycled = [] if PARAMS.RECYCLE_ITEMS else None
+        loop = 0
+        while playback_loops == 0 or loop < playback_loops:
+            loop += 1
+            if loop > 1 and recycled:
+                items = recycled
+            else:
+                runs = frame_runs(load_frames(loop - 1), dedup)
+                items = (traced_prepare_item(frame, img, roi, repeat_count, loop - 1) for frame, img, repeat_count in runs)
+            for item in items:
+                # the feeder closes the queue when the projection is stopped early
+                if message_queue.closed: return
+                if TRACER is None:
+                    message_queue.put(item)
+                else:
+                    # time spent blocked at the high-water mark
+                    start = time.perf_counter_ns()
+                    message_queue.put(item)
+                    TRACER.span("queue put", start, TRACER.frame_of(item), loop=loop - 1)
+                if loop == 1 and recycled is not None:
+                    recycled.append(item)
+    finally:
+        # Wake up the feeder even when loading fails
+        message_queue.close()
+
+
+def start_background_loader(message_queue: BoundedGaugedQueue, playback_loops: Optional[int] = None, image_directory: str = IMAGE_FOLDER_NAME, 
+                            dedup: Optional[bool] = None) -> threading.Thread:
+    loader = threading.Thread(
+        target=stream_images_into_queue, 
+        args=(message_queue, playback_loops, image_directory, None, dedup), 
+        name="image-loader", 
+        daemon=True
+    )
+    loader.start()
+    return loader
 
     
-def connect_device():    
-    # Connect with the DMD device
+def connect_device(device_number: Optional[int] = None, ip_address: Optional[str] = None):    
+    # Connect with the DMD device, the one given by -d and -i unless another one is named
     
     ajileSystem = aj.HostSystem()
     ajileSystem.SetConnectionSettingsStr(
-        PARAMS.ipAddress, 
+        PARAMS.ipAddress if ip_address is None else ip_address, 
         PARAMS.netmask, 
         PARAMS.gateway, 
         PARAMS.port
     )
 
-    ajileSystem.SetUSB3DeviceNumber(PARAMS.deviceNumber)
+    ajileSystem.SetUSB3DeviceNumber(PARAMS.deviceNumber if device_number is None else device_number)
     ajileSystem.SetCommunicationInterface(PARAMS.commInterface)
     if ajileSystem.StartSystem() != aj.ERROR_NONE:
         print("Error starting AjileSystem. Did you specify the correct interface with the command line arguments, e.g. \"--usb3\"?")
@@ -146,65 +554,240 @@ def init_project(device_connected, device_type, project_title: str = PROJECT_TIT
     return project
 
 
-def run_streaming_on(device_connected: Any):
+class FeederStats(NamedTuple):
+    items: int # sequence items submitted to the device
+    submit_seconds: float # time spent in timing.apply and AddStreamingSequenceItem, waits excluded
+    elapsed_seconds: float # from the first refill until the device stopped
+
 
+class DeviceSession(NamedTuple):
+    device_connected: Any
+    driver: Any
+    project: Any
+    dmd_index: int
+    image_width: int
+    watcher: DeviceStateWatcher
+
+
+def prepare_device(device_connected: Any) -> DeviceSession:
+    """
+    Stop whatever runs on the device and load the streaming project
+    Needs no frames, so it can run while the volume is still being prepared
+    """
     # Retrieve components from existing project
     dmdIndex, deviceType, imageWidth, imageHeight = retrieve_components(device_connected)
+    if (imageWidth, imageHeight) != (PARAMS.imageWidth, PARAMS.imageHeight):
+        # generated frames (helix slicing, full-frame regions) are sized from the parameters
+        print(f"Warning: the DMD is {imageWidth}x{imageHeight} but frames are generated at {PARAMS.imageWidth}x{PARAMS.imageHeight}, adjust imageWidth and imageHeight")
     
     # initialize the project
     project = init_project(device_connected, deviceType)
 
     driver = device_connected.GetDriver()
+    watcher = DeviceStateWatcher(device_connected, dmdIndex)
 
     # stop any existing project from running on the device
     driver.StopSequence(dmdIndex)
     print ("Waiting for the sequence to stop.")
-    while device_connected.GetDeviceState(dmdIndex).RunState() != aj.RUN_STATE_STOPPED: pass
+    if not watcher.wait_until_stopped(PARAMS.STATE_TIMEOUT_S):
+        raise TimeoutError(f"Device did not stop within {PARAMS.STATE_TIMEOUT_S}s")
         
     # load the project
     driver.LoadProject(project)
     driver.WaitForLoadComplete(-1)
+    
+    return DeviceSession(device_connected, driver, project, dmdIndex, imageWidth, watcher)
+
 
+class FeederProgress:
+    # live counter of a feeder, read by the multi-device report
+    def __init__(self):
+        self.submitted = 0
+
+
+def feed_device(session: DeviceSession, message_queue: GaugedQueue = MESSAGE_QUEUE, timing: Optional[FrameTimingEngine] = None, timeline: Optional[StartupTimeline] = None, 
+                start_barrier: Optional[threading.Barrier] = None, progress: Optional[FeederProgress] = None) -> FeederStats:
+    """
+    Keep a prepared device supplied with items from message_queue until it is exhausted or q is pressed
+    With start_barrier, the sequence starts only once every feeder sharing the barrier is ready to start
+    """
+    driver, project, dmdIndex, imageWidth, watcher = session.driver, session.project, session.dmd_index, session.image_width, session.watcher
+    
     # local variables used to generate DMD images
-    maxStreamingSequenceItems = PARAMS.MaxStreamingMemoryUsage / getImageSize(project, dmdIndex)
+    framesPerItem = len(PARAMS.DMDGrayscaleFrameTime) if PARAMS.GRAYSCALE_BITPLANES else 1
+    maxStreamingSequenceItems = min(PARAMS.MaxStreamingMemoryUsage // (getImageSize(project, dmdIndex) * framesPerItem), PARAMS.MaxStreamingFIFOSize)
+    
+    def fifo_thresholds(capacity: int) -> Tuple[int, int]:
+        # refill in batches once the device drops below the low watermark
+        lowWatermark = PARAMS.REFILL_LOW_WATERMARK if PARAMS.REFILL_LOW_WATERMARK > 0 else capacity // 2
+        # start projecting once this many items are on the device instead of waiting for a full FIFO
+        startThreshold = min(PARAMS.START_PRELOAD_ITEMS, capacity) if PARAMS.START_PRELOAD_ITEMS > 0 else capacity
+        return max(1, min(lowWatermark, capacity)), startThreshold
+    
+    lowWatermark, startThreshold = fifo_thresholds(maxStreamingSequenceItems)
 
     keyPress = '0'
+    submitted = 0
+    submitSeconds = 0.0
+    feedStart = time.perf_counter()
     
     have_called = False # Ensure startSequence only get executed once
+    startResult = aj.ERROR_NONE
+    submitResult = aj.ERROR_NONE
+    pendingItem = None # item the device had no memory for, submitted again once its FIFO has drained
+    draining = False
+    start_released = start_barrier is None
+    lite_mode_checked = False
+    
+    tracer = TRACER
+    traceFrame = -1 # first source frame of the item in hand
+    traceLoop = 0 # playback loop, counted here as the frames of a pass come in ascending order
+    if tracer is not None:
+        # FIFO levels of this feeder's device, an underrun is the FIFO running dry with items still to send
+        fifo_probe = tracer.watch_fifo(watcher, f"FIFO {threading.current_thread().name}", lambda: have_called and not draining)
     
-    while keyPress != 'q' and keyPress != 'Q' and len(MESSAGE_QUEUE) > 0:
+    while keyPress != 'q' and keyPress != 'Q' and (pendingItem is not None or not message_queue.exhausted()):
         # if not driver.IsSequenceStatusQueueEmpty(dmdIndex):
         #     seqStatus = driver.GetNextSequenceStatus(dmdIndex)
-        num_of_streaming_items = driver.GetNumStreamingSequenceItems(dmdIndex)
+        num_of_streaming_items = watcher.fifo_level()
             
-        if num_of_streaming_items < maxStreamingSequenceItems:
-            streamingSeqItem = MESSAGE_QUEUE.get()
-            # send the streaming sequence item to the device
-            driver.AddStreamingSequenceItem(streamingSeqItem, dmdIndex)
+        if num_of_streaming_items < lowWatermark or (not have_called and num_of_streaming_items < maxStreamingSequenceItems):
+            # the FIFO level is queried once per batch, the running count covers the items in between
+            batchSize = min(PARAMS.SUBMIT_BATCH_SIZE, maxStreamingSequenceItems - num_of_streaming_items)
+            for _ in range(batchSize):
+                if pendingItem is not None:
+                    streamingSeqItem, pendingItem = pendingItem, None
+                elif message_queue.exhausted():
+                    break
+                else:
+                    # blocks while a background loader is still producing
+                    getStart = time.perf_counter_ns()
+                    streamingSeqItem = message_queue.get()
+                    if streamingSeqItem is None:
+                        break
+                    if tracer is not None:
+                        frame = tracer.frame_of(streamingSeqItem)
+                        if frame <= traceFrame:
+                            traceLoop += 1
+                        traceFrame = frame
+                        tracer.span("queue get", getStart, traceFrame, loop=traceLoop)
+                        if isinstance(message_queue, GaugedQueue):
+                            tracer.counter(f"queue {threading.current_thread().name}", len(message_queue))
+                # if using region-of-interest, switch to 'lite mode' to disable lighting/triggers and allow DMD to run faster
+                if not lite_mode_checked:
+                    roiWidthColumns = streamingSeqItem.Frames()[0].RoiWidthColumns()
+                    if 0 < roiWidthColumns < imageWidth:
+                        print(f"Region of interest is {roiWidthColumns} columns wide. Switching to lite mode")
+                        driver.SetLiteMode(True, dmdIndex)
+                    lite_mode_checked = True
+                if tracer is not None and have_called:
+                    # the device may have run dry while this item was awaited
+                    fifo_probe.sample(watcher.fifo_level())
+                submitStart = time.perf_counter()
+                # follow the latest motor speed
+                if timing is not None:
+                    timing.apply(streamingSeqItem)
+                # send the streaming sequence item to the device
+                result = driver.AddStreamingSequenceItem(streamingSeqItem, dmdIndex)
+                submitEnd = time.perf_counter()
+                submitSeconds += submitEnd - submitStart
+                if result == aj.ERROR_OUT_OF_MEMORY and num_of_streaming_items > 0:
+                    # the device memory holds fewer items than estimated, keep the item until the FIFO has drained
+                    pendingItem = streamingSeqItem
+                    if num_of_streaming_items < maxStreamingSequenceItems:
+                        print(f"Device memory full at {num_of_streaming_items} items, keeping the FIFO below that")
+                        maxStreamingSequenceItems = num_of_streaming_items
+                        lowWatermark, startThreshold = fifo_thresholds(maxStreamingSequenceItems)
+                    break
+                if result != aj.ERROR_NONE:
+                    submitResult = result
+                    break
+                if tracer is not None:
+                    tracer.span("submit", int(submitStart * 1e9), traceFrame, int(submitEnd * 1e9), traceLoop)
+                    fifo_probe.item_submitted()
+                submitted += 1
+                if progress is not None:
+                    progress.submitted = submitted
+                if submitted == 1 and timeline is not None:
+                    timeline.mark("first item submitted")
+                num_of_streaming_items += 1
+            if submitResult != aj.ERROR_NONE:
+                break
             
         else:
-            # when enough images have been preloaded start the streaming sequence
-            if device_connected.GetDeviceState(dmdIndex).RunState() == aj.RUN_STATE_STOPPED and not have_called:
-                print(f"Starting Sequence: {PARAMS.sequenceID}")
-                driver.StartSequence(PARAMS.sequenceID, dmdIndex)
-                have_called = True
-            # check for a keypress to quit
+            # sleep until the device drains below the low watermark, checking for a keypress to quit in between
+            watcher.wait_for_fifo_below(lowWatermark, PARAMS.KEY_POLL_INTERVAL_S)
             # cv2.imshow("AJILE Streaming DMD Example", npImage)
-            keyPress = cv2.waitKey(10)
+            import cv2
+            keyPress = cv2.waitKey(1)
             keyPress = chr(keyPress % 256) if keyPress%256 < 128 else '?'
+        
+        # when enough images have been preloaded start the streaming sequence
+        if not have_called and (num_of_streaming_items >= startThreshold or (pendingItem is None and message_queue.exhausted())):
+            if not start_released:
+                start_released = True
+                try:
+                    # projectors start together so that their frames stay interleaved
+                    start_barrier.wait(PARAMS.STATE_TIMEOUT_S)
+                except threading.BrokenBarrierError:
+                    print("Not every projector was ready in time, starting without them")
+            if watcher.run_state() == aj.RUN_STATE_STOPPED:
+                print(f"Starting Sequence: {PARAMS.sequenceID}")
+                startResult = driver.StartSequence(PARAMS.sequenceID, dmdIndex)
+                if startResult != aj.ERROR_NONE:
+                    break
+                have_called = True
+                if tracer is not None:
+                    tracer.instant("sequence started")
+                if timeline is not None:
+                    # the first frame is on the DMD once the sequence reports running
+                    watcher.wait_until_running(PARAMS.STATE_TIMEOUT_S)
+                    timeline.mark("first frame projected")
+
+    # the FIFO running dry from here on is the end of the volume, not an underrun
+    draining = True
+    
+    # let the device display the items it already holds unless we quit early
+    if have_called and keyPress != 'q' and keyPress != 'Q' and submitResult == aj.ERROR_NONE:
+        print("Waiting for the device to display the remaining items.")
+        # give up once the device stops or its FIFO has not moved for STATE_TIMEOUT_S
+        fifo_level = watcher.fifo_level()
+        while fifo_level > 0:
+            if not watcher.wait_for(lambda: watcher.fifo_level() < fifo_level or watcher.run_state() != aj.RUN_STATE_RUNNING, PARAMS.STATE_TIMEOUT_S):
+                print(f"Device still holds {fifo_level} items after {PARAMS.STATE_TIMEOUT_S}s without progress")
+                break
+            if watcher.last_run_state != aj.RUN_STATE_RUNNING:
+                print(f"Device stopped with {watcher.last_fifo_level} items left")
+                break
+            fifo_level = watcher.last_fifo_level
 
     # stop the device when we are done
     driver.StopSequence(dmdIndex)
     print ("Waiting for the sequence to stop.\n")
     
-    while device_connected.GetDeviceState(dmdIndex).RunState() == aj.RUN_STATE_RUNNING: pass
+    if not watcher.wait_until_not_running(PARAMS.STATE_TIMEOUT_S):
+        print(f"Device still running after {PARAMS.STATE_TIMEOUT_S}s")
     
+    if startResult != aj.ERROR_NONE:
+        raise RuntimeError(f"Failed to start sequence {PARAMS.sequenceID}: error {startResult}")
+    if submitResult != aj.ERROR_NONE:
+        raise RuntimeError(f"Failed to add a sequence item to the device: error {submitResult}")
+    
+    stats = FeederStats(submitted, submitSeconds, time.perf_counter() - feedStart)
+    print(f"Submitted {stats.items} items, {stats.submit_seconds / max(stats.items, 1) * 1e6:.1f} us per item in the feeder")
+    return stats
+    
+
+def run_streaming_on(device_connected: Any, message_queue: GaugedQueue = MESSAGE_QUEUE, timing: Optional[FrameTimingEngine] = None) -> FeederStats:
+    return feed_device(prepare_device(device_connected), message_queue, timing)
+
 
 async def test():
     # Will be using default parameters for local testing
     print("Device not detected running offline testing")
     
-    load_images_with_message_queue()
+    if not MESSAGE_QUEUE:
+        load_images_with_message_queue()
     test_loop()
 
         
@@ -220,24 +803,290 @@ def test_loop():
             num_of_streaming_items += 1
 
         
-async def main():
-    # connect to the device simultaneously with loading image into memory    
-    loop = asyncio.get_running_loop()
-    with ThreadPoolExecutor(max_workers=1) as executor:
-        try_connect = loop.run_in_executor(executor, connect_device)
-        prepare_images = loop.run_in_executor(executor, load_images_with_message_queue, 4)
+def create_timing_engine() -> Optional[FrameTimingEngine]:
+    if PARAMS.MOTOR_SPEED_RPM <= 0:
+        return None
+    
+    timing = FrameTimingEngine(PARAMS.MOTOR_SPEED_RPM, PARAMS.TICKS_PER_REVOLUTION, bitplanes=PARAMS.GRAYSCALE_BITPLANES, min_frame_time=PARAMS.MIN_FRAME_TIME_MS)
+    print(f"Frame time {timing.frame_time_ms:.4f}ms for {PARAMS.MOTOR_SPEED_RPM} rev/min and {PARAMS.TICKS_PER_REVOLUTION} ticks per revolution")
+    if PARAMS.HALL_SENSOR_SYNC:
+        follow_hall_sensor(timing)
+        print("Following the motor speed measured by the Hall sensor")
+    return timing
+
+
+def start_device(timeline: StartupTimeline) -> Optional[DeviceSession]:
+    # driver import, connection and project load, everything the device needs before the first item
+    with timeline.phase("driver import"):
+        aj.load()
+    with timeline.phase("connect"):
+        device_connected = connect_device()
+    if device_connected is None:
+        return None
+    with timeline.phase("stop and load project"):
+        return prepare_device(device_connected)
+
+
+def import_decoder(timeline: StartupTimeline) -> None:
+    # the image folder is the only source decoded with cv2
+    if PARAMS.ARCHIVE_FILE is None and PARAMS.STL_FILE is None and PARAMS.VOLUME_FILE is None:
+        with timeline.phase("cv2 import"):
+            import cv2
 
-    coroutines = [try_connect, prepare_images]
-    device_connected, _ = await asyncio.gather(*coroutines)
+
+def preprocess_volume(timeline: StartupTimeline) -> None:
+    import_decoder(timeline)
+    with timeline.phase("preprocessing"):
+        load_images_with_message_queue()
+
+
+def run_streaming_mode(timeline: Optional[StartupTimeline] = None):
+    """
+    Let the loader fill the bounded queue while the device is connected and loaded, then feed it
+    """
+    timeline = StartupTimeline() if timeline is None else timeline
+    
+    message_queue = BoundedGaugedQueue(PARAMS.QUEUE_HIGH_WATER_MARK)
+    if PARAMS.STATS_INTERVAL_S > 0:
+        message_queue.start_exporter(PARAMS.STATS_INTERVAL_S)
+    loader = start_background_loader(message_queue)
+    
+    session = start_device(timeline)
+    if session is None:
+        print("Deviced undetected. Streaming mode requires a device")
+    else:
+        feed_device(session, message_queue, create_timing_engine(), timeline)
+        timeline.report()
+    
+    message_queue.close()
+    loader.join()
+    message_queue.stop_exporter()
+
+        
+def device_targets() -> List[Tuple[int, str]]:
+    # (USB3 device number, IP address) of every projector in multi-device mode
+    return ([(device_number, PARAMS.ipAddress) for device_number in PARAMS.DEVICE_NUMBERS] + 
+            [(PARAMS.deviceNumber, ip_address) for ip_address in PARAMS.DEVICE_ADDRESSES])
+
+
+def start_devices(targets: List[Tuple[int, str]], timeline: StartupTimeline) -> List[DeviceSession]:
+    # every projector is connected and loaded on its own thread
+    def start_one(target: Tuple[int, str]) -> Optional[DeviceSession]:
+        with timeline.phase(f"connect and load {target[0]}/{target[1]}"):
+            device_connected = connect_device(*target)
+            return None if device_connected is None else prepare_device(device_connected)
+    
+    aj.load()
+    with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+        sessions = list(executor.map(start_one, targets))
+    
+    for target, session in zip(targets, sessions):
+        if session is None:
+            print(f"Projector {target[0]}/{target[1]} undetected, continuing without it")
+    return [session for session in sessions if session is not None]
+
+
+def select_shard(items: Sequence[Any], index: int, count: int, mode: str) -> List[Any]:
+    """
+    Items of projector index out of count
+    interleave gives it every count-th item, so the projectors show consecutive slices in turn;
+    block gives it one contiguous part of the volume
+    """
+    if mode == "block":
+        return list(items[len(items) * index // count:len(items) * (index + 1) // count])
+    return list(items[index::count])
+
+
+def load_sharded_volume(timeline: StartupTimeline) -> Tuple[List[np.ndarray], Optional[RegionOfInterest]]:
+    # the frames of the whole volume and their region of interest, items are built per shard once the projectors are known
+    import_decoder(timeline)
+    with timeline.phase("preprocessing"):
+        images = list(open_frame_source()())
+        roi = find_region_of_interest(images) if PARAMS.AUTO_ROI else None
+    if roi is not None:
+        print(f"Region of interest: {roi}")
+    return images, roi
+
+
+def build_shard_items(images: Sequence[np.ndarray], roi: Optional[RegionOfInterest], count: int) -> List[List[Any]]:
+    """
+    Sequence items of each of count projectors
+    Frames are sharded before redundant ones are collapsed, so a repeat count always stands for
+    that many of the projector's own frame slots and the projectors stay in step
+    """
+    shards = []
+    for index in range(count):
+        frames = select_shard(images, index, count, PARAMS.SHARD_MODE)
+        # the frames keep their index in the whole volume
+        indices = select_shard(range(len(images)), index, count, PARAMS.SHARD_MODE)
+        shards.append(build_sequence_item_pool(frame_runs(frames, indices=indices), roi))
+    return shards
+
+
+def distribute_round_robin(source: BoundedGaugedQueue, targets: List[BoundedGaugedQueue]) -> None:
+    # streaming mode: deal the loader's items out to the projectors' queues in turn
+    # a queue closed by its feeder is skipped, so one projector stopping early does not stall the others
+    try:
+        index = 0
+        while True:
+            item = source.get()
+            if item is None:
+                return
+            for _ in range(len(targets)):
+                if not targets[index].closed:
+                    break
+                index = (index + 1) % len(targets)
+            else:
+                return
+            targets[index].put(item)
+            index = (index + 1) % len(targets)
+    finally:
+        source.close()
+        for target in targets:
+            target.close()
+
+
+def report_devices(sessions: List[DeviceSession], progresses: List[FeederProgress], interval_s: float, stop_event: threading.Event) -> None:
+    # FIFO level and submission rate of every projector, and their total rate
+    last_submitted = [0] * len(sessions)
+    last_time = time.perf_counter()
+    while not stop_event.wait(interval_s):
+        now = time.perf_counter()
+        elapsed = max(now - last_time, 1e-9)
+        rates = [(progress.submitted - last) / elapsed for progress, last in zip(progresses, last_submitted)]
+        # the level each feeder saw last, querying the drivers from here would race with the feeders
+        levels = [session.watcher.last_fifo_level for session in sessions]
+        print(" | ".join(f"device {index}: FIFO {level} items, {rate:.1f} items/s" for index, (level, rate) in enumerate(zip(levels, rates))) + 
+              f" | total {sum(rates):.1f} items/s")
+        last_submitted = [progress.submitted for progress in progresses]
+        last_time = now
+
+
+def run_multi_device(targets: List[Tuple[int, str]], timeline: StartupTimeline) -> None:
+    """
+    Drive several projectors at once: the volume is prepared once, each projector gets a shard
+    of its items and its own feeder thread, and the sequences start together
+    """
+    loader = None
+    if PARAMS.STREAMING_MODE:
+        if PARAMS.SHARD_MODE != "interleave":
+            print("Streaming mode does not know the volume size in advance, interleaving the frames instead")
+        source = BoundedGaugedQueue(PARAMS.QUEUE_HIGH_WATER_MARK)
+        # items are dealt out one by one, so each must be a single frame for the projectors to stay in step
+        loader = start_background_loader(source, dedup=False)
+        sessions = start_devices(targets, timeline)
+        queues = [BoundedGaugedQueue(max(1, PARAMS.QUEUE_HIGH_WATER_MARK // max(len(sessions), 1))) for _ in sessions]
+        distributor = threading.Thread(target=distribute_round_robin, args=(source, queues), name="item-distributor", daemon=True)
+        distributor.start()
+    else:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            device_setup = executor.submit(start_devices, targets, timeline)
+            images, roi = executor.submit(load_sharded_volume, timeline).result()
+            sessions = device_setup.result()
+        queues = [CyclicPlaylist(items, PARAMS.PLAYBACK_LOOPS) for items in build_shard_items(images, roi, len(sessions))]
+        del images
+    
+    if not sessions:
+        print("No projector detected")
+    else:
+        print(f"Projecting on {len(sessions)} devices, {PARAMS.SHARD_MODE if not PARAMS.STREAMING_MODE else 'interleave'} sharding")
+        timing = create_timing_engine()
+        barrier = threading.Barrier(len(sessions))
+        progresses = [FeederProgress() for _ in sessions]
+        
+        stop_report = threading.Event()
+        if PARAMS.STATS_INTERVAL_S > 0:
+            threading.Thread(target=report_devices, args=(sessions, progresses, PARAMS.STATS_INTERVAL_S, stop_report), name="device-report", daemon=True).start()
+        
+        def feed_and_close(session: DeviceSession, queue: Any, timeline: Optional[StartupTimeline], progress: FeederProgress) -> FeederStats:
+            try:
+                return feed_device(session, queue, timing, timeline, barrier, progress)
+            finally:
+                # however the feeder ends, stop the distributor from waiting on its queue
+                if isinstance(queue, BoundedGaugedQueue):
+                    queue.close()
+        
+        try:
+            with ThreadPoolExecutor(max_workers=len(sessions), thread_name_prefix="feeder") as executor:
+                feeders = [executor.submit(feed_and_close, session, queue, timeline if index == 0 else None, progress) 
+                           for index, (session, queue, progress) in enumerate(zip(sessions, queues, progresses))]
+                results = [feeder.result() for feeder in feeders]
+        finally:
+            stop_report.set()
+            if loader is not None:
+                source.close()
+        
+        for index, stats in enumerate(results):
+            print(f"Device {index}: {stats.items} items in {stats.elapsed_seconds:.3f}s, {stats.items / max(stats.elapsed_seconds, 1e-9):.1f} items/s")
+        total_items = sum(stats.items for stats in results)
+        elapsed = max(max(stats.elapsed_seconds for stats in results), 1e-9)
+        print(f"All devices: {total_items} items in {elapsed:.3f}s, {total_items / elapsed:.1f} items/s")
+        timeline.report()
+    
+    if loader is not None:
+        for queue in queues:
+            queue.close()
+        source.close()
+        loader.join()
+
+
+async def main(argv: Optional[List[str]] = None):
+    global TRACER
+    timeline = StartupTimeline(LAUNCH_TIME)
+    with timeline.phase("parse configuration"):
+        configure(get_command_arguments(argv))
+    
+    if PARAMS.TRACE_FILE is None:
+        await run_projection(timeline)
+        return
+    
+    # the trace is written even when the projection fails, it is most useful then
+    TRACER = FrameTracer()
+    try:
+        await run_projection(timeline)
+    finally:
+        TRACER.report()
+        TRACER.write(PARAMS.TRACE_FILE)
+        TRACER = None
+
+
+async def run_projection(timeline: StartupTimeline) -> None:
+    targets = device_targets()
+    if len(targets) > 1:
+        run_multi_device(targets, timeline)
+        print("Program ended without error")
+        return
+    
+    if PARAMS.STREAMING_MODE:
+        run_streaming_mode(timeline)
+        print("Program ended without error")
+        return
     
-    if device_connected is None: 
+    # connect to and load the device on one thread while the volume is prepared on the other
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        device_setup = loop.run_in_executor(executor, start_device, timeline)
+        preprocessing = loop.run_in_executor(executor, preprocess_volume, timeline)
+        session, _ = await asyncio.gather(device_setup, preprocessing)
+    
+    if session is None: 
         print("Deviced undetected. Switch to test cases ")
-        test()
+        await test()
+        return
         
-    run_streaming_on(device_connected)
+    # the feeder replays the loaded volume, so report the device rather than the already full queue
+    progress = FeederProgress()
+    stop_report = threading.Event()
+    if PARAMS.STATS_INTERVAL_S > 0:
+        threading.Thread(target=report_devices, args=([session], [progress], PARAMS.STATS_INTERVAL_S, stop_report), name="device-report", daemon=True).start()
+    
+    # replay the loaded volume instead of copying it into a longer queue
+    feed_device(session, CyclicPlaylist(MESSAGE_QUEUE, PARAMS.PLAYBACK_LOOPS), create_timing_engine(), timeline, progress=progress)
+    stop_report.set()
+    timeline.report()
     
     print("Program ended without error")
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
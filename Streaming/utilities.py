@@ -1,9 +1,11 @@
 import sys
 import time
+import threading
+import contextlib
 from collections import deque
 from typing import *
 
-import ajiledriver as aj
+from driver_backend import aj
 from constants import *
 
 def getImageSize(project, componentIndex):
@@ -11,19 +13,42 @@ def getImageSize(project, componentIndex):
     imageSize = component.NumRows() * component.NumColumns()
     if (component.DeviceType().HardwareType() == aj.DMD_4500_DEVICE_TYPE or
         component.DeviceType().HardwareType() == aj.DMD_3000_DEVICE_TYPE):
-        imageSize = imageSize / 8
+        imageSize = imageSize // 8
     return imageSize
 
 
-def calc_frame_time_from_motor_speed(motor_speed: float, number_of_ticks: int = 1600) -> float:
+def calc_frame_time_from_motor_speed(motor_speed: float, number_of_ticks: int = 1600, min_frame_time: float = AJParameters.MIN_FRAME_TIME_MS) -> float:
     """
     It only works when motor_speed is in rev/min and it returns frametime in milliseconds  
     """
+    if motor_speed <= 0:
+        raise ValueError(f"Invalid motor speed: {motor_speed} rev/min")
     frame_time = 60 * 1000 / (motor_speed * number_of_ticks)
-    if 0 < frame_time < 1:
-        raise f"Invalid frame time: {frame_time}ms. Please adjust motor speed or number of ticks per revolution"
+    if frame_time < min_frame_time:
+        raise ValueError(f"Invalid frame time: {frame_time}ms, below the minimum of {min_frame_time}ms. Please adjust motor speed or number of ticks per revolution")
     return frame_time
 
+def bitplane_weights() -> List[float]:
+    # share of the slice time of bitplanes 0 to 7, binary-weighted like DMDGrayscaleFrameTime
+    total = sum(AJParameters.DMDGrayscaleFrameTime)
+    return [frame_time / total for frame_time in AJParameters.DMDGrayscaleFrameTime]
+
+
+def min_slice_time_ms(bitplanes: bool, min_frame_time: Optional[float] = None) -> float:
+    # shortest slice time that keeps every DMD frame, the least significant bitplane included, above min_frame_time
+    min_frame_time = AJParameters.MIN_FRAME_TIME_MS if min_frame_time is None else min_frame_time
+    return min_frame_time / min(bitplane_weights()) if bitplanes else min_frame_time
+
+
+def split_slice_time(slice_ticks: int) -> List[int]:
+    """
+    Frame times of the 8 bitplanes of a slice shown for slice_ticks
+    The one rule for bitplane timing: the slice lasts one frame time, static or from the motor
+    speed, and its planes share it with binary weights
+    """
+    return [max(1, round(slice_ticks * weight)) for weight in bitplane_weights()]
+
+
 # Provided method in the example helper
 def PrintUsage():
     print ("Usage: " + sys.argv[0] + " [options]")
@@ -35,91 +60,444 @@ def PrintUsage():
     print ("\t--usb3:\t use the USB3 interface (default is USB2)")
     print ("\t--pcie:\t use the PCIE interface (default is USB2)")
     print ("\t-d <deviceNumber>:\t use a different device number than device 0")
+    print("\t--devices <n1,n2,...>:\t drive several projectors, given by their USB3 device numbers")
+    print("\t--ips <ip1,ip2,...>:\t drive several projectors, given by their IP addresses")
+    print("\t--shard <interleave|block>:\t split of the frames between projectors (default interleave)")
     print ("\t--roi <roiFirstRow> <roiNumRows>:\t set the region of interest (first row and number of rows) used by the camera")
     print ("\t--sub <subsampleRowSkip>:\t enable camera image subsampling, specifying the number of rows to skip between each row (e.g. 1 skips every other row so selects every 2nd row, 3 selects every 4th row, etc.")
     print("\t--bit <bit depth>:\t set the camera bit depth, either 10 (default) or 8")
+    print("\t-w <workers>:\t number of image decoding workers (default is the number of cores)")
+    print("\t--processes:\t decode images with a process pool instead of a thread pool")
+    print("\t--frame-bits <bit depth>:\t bit depth of the streamed frames, either 1 (default, packed binary) or 8")
+    print("\t--bitplanes:\t stream greyscale images as 8 binary-weighted bitplanes sharing the frame time, 38.25ms unless -f is given")
+    print("\t--threshold <level>:\t greyscale level above which a pixel is on in 1-bit frames (default 127)")
+    print("\t--no-roi:\t stream full frames instead of cropping them to the region of interest")
+    print("\t--stream-roi:\t in streaming mode, crop to the region of interest too, which reads the whole volume before the first item")
+    print("\t--no-dedup:\t send every frame even when it repeats the previous one")
+    print("\t--drop-blank:\t do not send all-black frames at all")
+    print("\t--no-cache:\t always decode the source images instead of using the frame cache")
+    print("\t--state-timeout <seconds>:\t how long to wait for the device to start or stop (default 10)")
+    print("\t--batch <items>:\t number of items sent to the device per refill (default 32)")
+    print("\t--low-watermark <items>:\t refill the device once it holds fewer items than this, 0 uses half of its capacity")
+    print("\t--stats <seconds>:\t interval between queue statistics reports, 0 disables them (default 1)")
+    print("\t--trace <file.json>:\t trace every frame from disk read to device submission and write a Chrome trace of it")
+    print("\t--loops <count>:\t number of times the volume is projected, 0 repeats forever (default 16)")
+    print("\t--rpm <rev/min>:\t derive the frame time from this motor speed instead of -f")
+    print("\t--ticks <count>:\t number of frames per motor revolution (default 1600)")
+    print("\t--min-frame-time <ms>:\t shortest frame time the DMD accepts, in milliseconds (default 0.04)")
+    print("\t--hall-sensor:\t follow the motor speed measured by the Hall sensor of the Sync controller, starting from --rpm")
+    print("\t--stream:\t load images in the background while they are being projected")
+    print("\t--hwm <items>:\t maximum number of prepared items held in memory in streaming mode")
+    print("\t--preload <items>:\t number of items sent to the device before the sequence starts, 0 waits for a full FIFO")
+    print("\t--recycle:\t in streaming mode, reuse the items of the first loop instead of loading the volume again")
+    print("\t--archive <file>:\t read the frames from an archive made by frame_archive.py instead of the image folder")
+    print("\t--stl <file>:\t slice an STL model along the helix instead of reading the image folder")
+    print("\t--volume <file.npy>:\t slice a (layers, rows, columns) voxel volume along the helix instead of reading the image folder")
+    print("\t--blades <count>:\t number of blades of the helical screen (default 1)")
+    print("\t--helix-height <pixels>:\t rise of a blade of the helical screen, in DMD pixels (default 912)")
 
 # Provided method in the example helper
-def get_command_arguments() -> AJParameters:
-    # read command line arguments
-    parameters = AJParameters
+def get_command_arguments(argv: Optional[List[str]] = None) -> AJParameters:
+    # read command line arguments, sys.argv when argv is not given
+    # settings go to a new AJParameters instance, the class keeps the defaults
+    args = sys.argv if argv is None else [sys.argv[0]] + list(argv)
+    parameters = AJParameters()
+    frame_time_given = False
     i=1
-    while i < len(sys.argv):
-        if sys.argv[i] == "-h" or sys.argv[i] == "--help":
+    while i < len(args):
+        if args[i] == "-h" or args[i] == "--help":
             PrintUsage()
-        elif sys.argv[i] == "-i":
-            parameters.ipAddress = sys.argv[i+1]
+        elif args[i] == "-i":
+            parameters.ipAddress = args[i+1]
             i += 1
-        elif sys.argv[i] == "-r":
-            parameters.repeatCount = int(sys.argv[i+1])
+        elif args[i] == "-r":
+            parameters.repeatCount = int(args[i+1])
             i += 1
-        elif sys.argv[i] == "-f":
-            parameters.frameTime_ms = float(sys.argv[i+1])
+        elif args[i] == "-f":
+            parameters.frameTime_ms = float(args[i+1])
+            frame_time_given = True
             i += 1
-        elif sys.argv[i] == "--usb3":
-            parameters.commInterface = aj.USB3_INTERFACE_TYPE
-        elif sys.argv[i] == "--pcie":
-            parameters.commInterface = aj.PCIE_INTERFACE_TYPE
-        elif sys.argv[i] == "-d":
-            parameters.deviceNumber = int(sys.argv[i+1])
+        elif args[i] == "--usb3":
+            parameters.commInterface = CommunicationInterfaceTypeEnum.USB3_INTERFACE_TYPE
+        elif args[i] == "--pcie":
+            parameters.commInterface = CommunicationInterfaceTypeEnum.PCIE_INTERFACE_TYPE
+        elif args[i] == "-d":
+            parameters.deviceNumber = int(args[i+1])
             i += 1
-        elif sys.argv[i] == "--roi":
-            parameters.roiFirstRow = int(sys.argv[i+1])
-            parameters.roiNumRows = int(sys.argv[i+2])
+        elif args[i] == "--roi":
+            parameters.roiFirstRow = int(args[i+1])
+            parameters.roiNumRows = int(args[i+2])
             i += 2
-        elif sys.argv[i] == "--sub":
-            parameters.subsampleRowSkip = int(sys.argv[i+1])
+        elif args[i] == "--sub":
+            parameters.subsampleRowSkip = int(args[i+1])
+            i += 1
+        elif args[i] == "--bit":
+            parameters.bitDepth = int(args[i+1])
+            i += 1
+        elif args[i] == "--devices":
+            parameters.DEVICE_NUMBERS = [int(number) for number in args[i+1].split(",")]
+            i += 1
+        elif args[i] == "--ips":
+            parameters.DEVICE_ADDRESSES = args[i+1].split(",")
+            i += 1
+        elif args[i] == "--shard":
+            parameters.SHARD_MODE = args[i+1]
+            i += 1
+        elif args[i] == "-w":
+            parameters.NUM_WORKERS = int(args[i+1])
+            i += 1
+        elif args[i] == "--processes":
+            parameters.USE_PROCESSES = True
+        elif args[i] == "--frame-bits":
+            parameters.FRAME_BIT_DEPTH = int(args[i+1])
+            i += 1
+        elif args[i] == "--bitplanes":
+            parameters.GRAYSCALE_BITPLANES = True
+        elif args[i] == "--threshold":
+            parameters.BINARY_THRESHOLD = int(args[i+1])
+            i += 1
+        elif args[i] == "--no-roi":
+            parameters.AUTO_ROI = False
+        elif args[i] == "--stream-roi":
+            parameters.STREAM_AUTO_ROI = True
+        elif args[i] == "--no-dedup":
+            parameters.DEDUP_FRAMES = False
+        elif args[i] == "--drop-blank":
+            parameters.DROP_BLANK_FRAMES = True
+        elif args[i] == "--no-cache":
+            parameters.USE_CACHE = False
+        elif args[i] == "--state-timeout":
+            parameters.STATE_TIMEOUT_S = float(args[i+1])
+            i += 1
+        elif args[i] == "--batch":
+            parameters.SUBMIT_BATCH_SIZE = int(args[i+1])
+            i += 1
+        elif args[i] == "--low-watermark":
+            parameters.REFILL_LOW_WATERMARK = int(args[i+1])
+            i += 1
+        elif args[i] == "--stats":
+            parameters.STATS_INTERVAL_S = float(args[i+1])
+            i += 1
+        elif args[i] == "--trace":
+            parameters.TRACE_FILE = args[i+1]
+            i += 1
+        elif args[i] == "--loops":
+            parameters.PLAYBACK_LOOPS = int(args[i+1])
+            i += 1
+        elif args[i] == "--rpm":
+            parameters.MOTOR_SPEED_RPM = float(args[i+1])
             i += 1
-        elif sys.argv[i] == "--bit":
-            parameters.bitDepth = int(sys.argv[i+1])
+        elif args[i] == "--ticks":
+            parameters.TICKS_PER_REVOLUTION = int(args[i+1])
+            i += 1
+        elif args[i] == "--min-frame-time":
+            parameters.MIN_FRAME_TIME_MS = float(args[i+1])
+            i += 1
+        elif args[i] == "--hall-sensor":
+            parameters.HALL_SENSOR_SYNC = True
+        elif args[i] == "--stream":
+            parameters.STREAMING_MODE = True
+        elif args[i] == "--hwm":
+            parameters.QUEUE_HIGH_WATER_MARK = int(args[i+1])
+            i += 1
+        elif args[i] == "--preload":
+            parameters.START_PRELOAD_ITEMS = int(args[i+1])
+            i += 1
+        elif args[i] == "--recycle":
+            parameters.RECYCLE_ITEMS = True
+        elif args[i] == "--archive":
+            parameters.ARCHIVE_FILE = args[i+1]
+            i += 1
+        elif args[i] == "--stl":
+            parameters.STL_FILE = args[i+1]
+            i += 1
+        elif args[i] == "--volume":
+            parameters.VOLUME_FILE = args[i+1]
+            i += 1
+        elif args[i] == "--blades":
+            parameters.HELIX_BLADES = int(args[i+1])
+            i += 1
+        elif args[i] == "--helix-height":
+            parameters.HELIX_HEIGHT = float(args[i+1])
             i += 1
         else:
             PrintUsage()
             sys.exit(2)
         i += 1
+    
+    if parameters.GRAYSCALE_BITPLANES and not frame_time_given:
+        parameters.frameTime_ms = parameters.GRAYSCALE_SLICE_TIME_MS
+    min_frame_time = min_slice_time_ms(parameters.GRAYSCALE_BITPLANES, parameters.MIN_FRAME_TIME_MS)
+    if parameters.frameTime_ms < min_frame_time:
+        print(f"Frame time {parameters.frameTime_ms}ms is below the minimum of {min_frame_time:.4f}ms" + 
+              (" for 8 bitplanes per slice" if parameters.GRAYSCALE_BITPLANES else ""))
+        sys.exit(2)
+    
+    # fail before any preprocessing or device setup rather than when the timing engine is created
+    if parameters.MOTOR_SPEED_RPM != 0 or parameters.HALL_SENSOR_SYNC:
+        try:
+            calc_frame_time_from_motor_speed(parameters.MOTOR_SPEED_RPM, parameters.TICKS_PER_REVOLUTION, min_frame_time)
+        except ValueError as error:
+            print(error)
+            sys.exit(2)
 
     return parameters
 
 
+HISTOGRAM_BUCKETS = 32 # log2 buckets, bucket i counts values in [2**(i-1), 2**i)
+
+
+class QueueStats(NamedTuple):
+    put_count: int
+    get_count: int
+    depth: int
+    max_depth: int
+    put_rate: float # items/s over the rolling window
+    get_rate: float
+    depth_histogram: List[int] # queue depth seen by each get
+    age_histogram_us: List[int] # time each item spent in the queue, in microseconds
+    age_p50_s: float
+    age_p99_s: float
+
+
+def histogram_percentile(histogram: List[int], fraction: float) -> int:
+    # upper bound of the bucket holding the given fraction of the samples
+    total = sum(histogram)
+    if total == 0:
+        return 0
+    threshold = fraction * total
+    cumulative = 0
+    for bucket, count in enumerate(histogram):
+        cumulative += count
+        if cumulative >= threshold:
+            return 2 ** bucket
+    return 2 ** (len(histogram) - 1)
+
+
+def print_queue_stats(stats: QueueStats) -> None:
+    print(f"Queue depth {stats.depth} (max {stats.max_depth}), input {stats.put_rate:.1f} fps, output {stats.get_rate:.1f} fps, "
+          f"item age p50 {stats.age_p50_s * 1e3:.2f} ms, p99 {stats.age_p99_s * 1e3:.2f} ms")
+
+
 class GaugedQueue(deque):
+    """
+    deque that measures its producer and consumer without printing on the hot path
+    put and get only stamp perf_counter_ns and bump counters and log2 histograms; each counter is 
+    written by one side only, so a single producer and a single consumer need no lock.
+    stats() builds a snapshot with rolling-window rates of put and get, extend counts its items but
+    leaves them out of the put rate, and start_exporter reports a snapshot periodically
+    """
     
-    def __init__(self, measure_per = 100):
+    def __init__(self, rate_window_s: float = 1.0, rate_samples: int = 4096):
         super().__init__()
-        self.prev_put = None
-        self.prev_get = None
         self.put_count = 0
         self.get_count = 0
+        self.max_depth = 0
+        
+        self.rate_window_ns = int(rate_window_s * 1e9)
+        self.put_times = deque(maxlen=rate_samples)
+        self.get_times = deque(maxlen=rate_samples)
+        self.enqueue_times = deque()
         
-        self.measure_per = measure_per
+        self.depth_histogram = [0] * HISTOGRAM_BUCKETS
+        self.age_histogram = [0] * HISTOGRAM_BUCKETS
+        
+        self.exporter = None
+        self.exporter_stop = threading.Event()
     
     def put(self, item: Any) -> None:
+        now = time.perf_counter_ns()
+        super().append(item)
+        self.enqueue_times.append(now)
+        self.put_times.append(now)
+        self.put_count += 1
         
-        if self.prev_put is None:
-            self.prev_put = time.time() 
+        if len(self) > self.max_depth:
+            self.max_depth = len(self)
+    
+    def extend(self, items: Iterable[Any]) -> None:
+        # a list first, so the queue can be extended with itself
+        items = list(items)
+        now = time.perf_counter_ns()
+        super().extend(items)
+        self.enqueue_times.extend([now] * len(items))
+        # a bulk load is not a producer rate: samples sharing one timestamp would make the rolling rate divide by a zero span
+        self.put_count += len(items)
         
-        elif self.put_count % self.measure_per == 0 and self.put_count != 0:
-            now = time.time()
-            print(f"Input frame rate: {self.measure_per  / (now - self.prev_put)} fps")
-            self.prev_put = now
-                
-        self.put_count += 1
-        super().append(item)
-
+        if len(self) > self.max_depth:
+            self.max_depth = len(self)
 
     def get(self) -> Any:
+        self.depth_histogram[min(len(self).bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+        item = super().popleft()
+        
+        now = time.perf_counter_ns()
+        age_us = (now - self.enqueue_times.popleft()) // 1000
+        self.age_histogram[min(age_us.bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+        self.get_times.append(now)
+        self.get_count += 1
+        
+        return item
+    
+    def exhausted(self) -> bool:
+        return len(self) == 0
+    
+    def _rolling_rate(self, times: deque, now: int) -> float:
+        # tuple() copies the deque in one step, so the other thread cannot mutate it mid-iteration
+        recent = [t for t in tuple(times) if t >= now - self.rate_window_ns]
+        if len(recent) < 2:
+            return 0.0
+        if len(recent) == times.maxlen:
+            # more events than samples in the window, use the span the samples cover
+            return (len(recent) - 1) * 1e9 / max(recent[-1] - recent[0], 1)
+        return len(recent) * 1e9 / self.rate_window_ns
+    
+    def stats(self) -> QueueStats:
+        now = time.perf_counter_ns()
+        age_histogram = list(self.age_histogram)
+        
+        return QueueStats(
+            put_count=self.put_count,
+            get_count=self.get_count,
+            depth=len(self),
+            max_depth=self.max_depth,
+            put_rate=self._rolling_rate(self.put_times, now),
+            get_rate=self._rolling_rate(self.get_times, now),
+            depth_histogram=list(self.depth_histogram),
+            age_histogram_us=age_histogram,
+            age_p50_s=histogram_percentile(age_histogram, 0.5) / 1e6,
+            age_p99_s=histogram_percentile(age_histogram, 0.99) / 1e6
+        )
+    
+    def start_exporter(self, interval_s: float, callback: Callable[[QueueStats], None] = print_queue_stats) -> None:
+        """
+        Hand a stats() snapshot to callback every interval_s from a background thread
+        """
+        if self.exporter is not None:
+            return
         
-        if self.prev_get is None:
-            self.prev_get = time.time() 
+        def export():
+            while not self.exporter_stop.wait(interval_s):
+                callback(self.stats())
         
-        elif self.get_count % self.measure_per == 0 and self.get_count != 0:
-            now = time.time()
-            print(f"Output frame rate: { self.measure_per  / (now - self.prev_get)} fps")
-            self.prev_get = now
-            print(f"No of remaining items: {len(self)}")
+        self.exporter_stop.clear()
+        self.exporter = threading.Thread(target=export, name="queue-stats", daemon=True)
+        self.exporter.start()
+    
+    def stop_exporter(self) -> None:
+        if self.exporter is None:
+            return
+        self.exporter_stop.set()
+        self.exporter.join()
+        self.exporter = None
+
+
+class BoundedGaugedQueue(GaugedQueue):
+    """
+    GaugedQueue shared by one producer thread and one consumer thread
+    put blocks at the high-water mark and get blocks while the queue is empty, 
+    until close is called. get returns None once the queue is closed and drained
+    """
+    
+    def __init__(self, high_water_mark: int, rate_window_s: float = 1.0):
+        super().__init__(rate_window_s)
+        self.high_water_mark = high_water_mark
+        self.closed = False
+        self.condition = threading.Condition()
+    
+    def put(self, item: Any) -> None:
+        with self.condition:
+            while len(self) >= self.high_water_mark and not self.closed:
+                self.condition.wait()
+            if self.closed:
+                return
+            super().put(item)
+            self.condition.notify_all()
+    
+    def get(self) -> Any:
+        with self.condition:
+            while len(self) == 0 and not self.closed:
+                self.condition.wait()
+            if len(self) == 0:
+                return None
+            item = super().get()
+            self.condition.notify_all()
+            return item
+    
+    def close(self) -> None:
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+    
+    def exhausted(self) -> bool:
+        return self.closed and len(self) == 0
+
+class StartupTimeline:
+    """
+    Start and end of the named startup phases, relative to launch_time
+    Phases can be recorded from any thread and may overlap; report() prints them as a breakdown
+    """
+    
+    def __init__(self, launch_time: Optional[float] = None):
+        self.launch_time = time.perf_counter() if launch_time is None else launch_time
+        self.phases = [] # (name, start, end, thread name)
+        self.lock = threading.Lock()
+    
+    def record(self, name: str, start: float, end: float) -> None:
+        with self.lock:
+            self.phases.append((name, start, end, threading.current_thread().name))
+    
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter())
+    
+    def mark(self, name: str) -> None:
+        now = time.perf_counter()
+        self.record(name, now, now)
+    
+    def report(self) -> None:
+        print("Startup breakdown (seconds since launch):")
+        with self.lock:
+            phases = sorted(self.phases, key=lambda phase: phase[1])
+        for name, start, end, thread_name in phases:
+            if start == end:
+                print(f"\t{name:<24} at {start - self.launch_time:8.3f}")
+            else:
+                print(f"\t{name:<24} {start - self.launch_time:8.3f} -> {end - self.launch_time:8.3f}  ({end - start:.3f}s on {thread_name})")
+
 
+class CyclicPlaylist:
+    """
+    Plays a loaded volume of prepared items playback_loops times, forever when it is 0
+    The same items are handed out on every loop and only an index moves, so memory stays flat
+    no matter how many rotations are projected. Offers the get/exhausted interface of the queues
+    """
+    
+    def __init__(self, items: Iterable[Any], playback_loops: int = 1):
+        # a tuple of references, the items themselves are not copied
+        self.items = tuple(items)
+        self.playback_loops = playback_loops
+        self.position = 0
+        self.completed_loops = 0
+    
+    def get(self) -> Any:
+        if self.exhausted():
+            return None
         
-        self.get_count += 1
-        return super().popleft()
+        item = self.items[self.position]
+        self.position += 1
+        if self.position == len(self.items):
+            self.position = 0
+            self.completed_loops += 1
+        return item
+    
+    def exhausted(self) -> bool:
+        return len(self.items) == 0 or (self.playback_loops > 0 and self.completed_loops >= self.playback_loops)
+
 
 if __name__ == "__main__":
     
@@ -0,0 +1,77 @@
+"""
+Resample dense voxel volumes along the surface of the helical screen
+
+Everything that only depends on the geometry is computed once and cached: which voxel column
+lies under each DMD pixel and the polar angle of the pixel. A frame is then the screen height at
+that tick turned into a voxel layer, and a single gather from the flattened volume.
+"""
+
+import functools
+from typing import *
+
+import numpy as np
+
+from helix import HelixGeometry, pixel_coordinates, surface_height
+
+
+class HelixLookupTable(NamedTuple):
+    pixels: np.ndarray # flat frame index of every pixel above the volume
+    columns: np.ndarray # flat (row, column) index of the voxel column under each of these pixels
+    theta: np.ndarray # polar angle of each of these pixels
+
+
+@functools.lru_cache(maxsize=8)
+def helix_lookup_table(geometry: HelixGeometry, volume_shape: Tuple[int, int, int]) -> HelixLookupTable:
+    """
+    Pixel to voxel column mapping of a (layers, rows, columns) volume centred on the rotation axis
+    and scaled uniformly so that its footprint fits inside the screen's cylinder. Volumes with the
+    same shape and geometry share the table
+    """
+    _, volume_rows, volume_columns = volume_shape
+    x, y, theta = pixel_coordinates(geometry)
+    pixels_per_voxel = geometry.radius() / np.hypot(volume_rows / 2, volume_columns / 2)
+
+    # volume row 0 is the top, like an image
+    column = np.floor(x / pixels_per_voxel + volume_columns / 2).astype(np.int64).ravel()
+    row = np.floor(volume_rows / 2 - y / pixels_per_voxel).astype(np.int64).ravel()
+    inside = (column >= 0) & (column < volume_columns) & (row >= 0) & (row < volume_rows)
+
+    pixels = np.flatnonzero(inside)
+    return HelixLookupTable(pixels, row[pixels] * volume_columns + column[pixels], theta.ravel()[pixels])
+
+
+class VoxelHelixSlicer:
+    """
+    Generates the frame of every motor tick for a (layers, rows, columns) volume, layer 0 at the
+    bottom of the screen. The layers are stretched over the height of a blade.
+    Frames have the volume's dtype, e.g. bool or greyscale uint8
+    """
+
+    def __init__(self, volume: np.ndarray, geometry: HelixGeometry = HelixGeometry()):
+        if volume.ndim != 3:
+            raise ValueError(f"Expected a (layers, rows, columns) volume, got shape {volume.shape}")
+        self.geometry = geometry
+        self.volume = np.ascontiguousarray(volume)
+        self.flat_volume = self.volume.reshape(-1)
+        self.layers = volume.shape[0]
+        self.layer_size = volume.shape[1] * volume.shape[2]
+        self.lut = helix_lookup_table(geometry, volume.shape)
+
+    @classmethod
+    def from_file(cls, path: str, geometry: HelixGeometry = HelixGeometry()) -> "VoxelHelixSlicer":
+        # .npy volumes are memory-mapped, only the voxels that are sampled are read
+        return cls(np.load(path, mmap_mode="r"), geometry)
+
+    def slice(self, tick: int) -> np.ndarray:
+        layer = (surface_height(self.geometry, self.lut.theta, tick) * (self.layers / self.geometry.height)).astype(np.int64)
+        np.minimum(layer, self.layers - 1, out=layer)
+
+        frame = np.zeros(self.geometry.rows * self.geometry.columns, dtype=self.volume.dtype)
+        frame[self.lut.pixels] = self.flat_volume[layer * self.layer_size + self.lut.columns]
+        return frame.reshape(self.geometry.rows, self.geometry.columns)
+
+    def frames(self, start_tick: int = 0, count: Optional[int] = None) -> Iterator[np.ndarray]:
+        # one revolution by default
+        count = self.geometry.ticks_per_revolution if count is None else count
+        for tick in range(start_tick, start_tick + count):
+            yield self.slice(tick)
@@ -0,0 +1,4 @@
+from .controller import STmic, find_controller_port
+from .edges import hysteresis_levels, find_edges, HysteresisEdgeDetector
+from .acquisition import PhaseEvent, RingBuffer, HallSensorReader
+from .triggers import TriggerRecord, TriggerScheduler
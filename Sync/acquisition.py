@@ -0,0 +1,164 @@
+import queue
+import threading
+import time
+from typing import *
+
+import numpy as np
+
+from .controller import STmic
+from .edges import HysteresisEdgeDetector
+
+
+class PhaseEvent(NamedTuple):
+    timestamp: float # perf_counter time of the sample where the edge was detected
+    phase: int # motor_phase_enum after the edge, 0 to HALL_SENSOR_COUNT - 1
+    level: int # digital level after the edge, 1 for high, 0 for low
+    interval: float # seconds since the previous edge, 0 for the first one
+
+
+class RingBuffer:
+    """
+    Fixed size buffer of the most recent samples and their timestamps
+    """
+
+    def __init__(self, capacity: int):
+        self.values = np.zeros(capacity, dtype=np.float64)
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.capacity = capacity
+        self.total = 0 # number of samples ever written
+        self.lock = threading.Lock()
+
+    def extend(self, values: np.ndarray, timestamps: np.ndarray) -> None:
+        values = values[-self.capacity:]
+        timestamps = timestamps[-self.capacity:]
+        with self.lock:
+            start = self.total % self.capacity
+            first = min(len(values), self.capacity - start)
+            self.values[start:start + first] = values[:first]
+            self.timestamps[start:start + first] = timestamps[:first]
+            self.values[:len(values) - first] = values[first:]
+            self.timestamps[:len(values) - first] = timestamps[first:]
+            self.total += len(values)
+
+    def latest(self, count: int) -> Tuple[np.ndarray, np.ndarray]:
+        # the last count samples in the order they were read, as copies
+        with self.lock:
+            count = min(count, self.total, self.capacity)
+            indices = (np.arange(self.total - count, self.total)) % self.capacity
+            return self.values[indices], self.timestamps[indices]
+
+
+class HallSensorReader:
+    """
+    Streams ADC sample blocks from an STmic on a dedicated thread
+    Samples are kept in a ring buffer and the edges of a whole block are found at once with
+    find_edges, so none are missed between samples. Each edge advances the motor phase and is
+    published as a PhaseEvent, both on the events queue and to every callback (called from the
+    reader thread). Within a block, sample times are spread evenly since the previous block,
+    unless sample_period is given.
+    The controller answers one 4-sample block per m1 command, so up to requests_in_flight commands
+    are kept queued on it and topped up in one write once half of them are answered. The serial
+    round trip is then paid once per batch instead of once per block, while every block is still
+    processed as soon as it arrives
+    """
+
+    def __init__(self, controller: STmic, buffer_size: int = 65536, sample_period: Optional[float] = None,
+                 callbacks: Iterable[Callable[[PhaseEvent], None]] = (), max_pending_events: int = 4096,
+                 requests_in_flight: int = 32):
+        self.controller = controller
+        self.requests_in_flight = max(1, requests_in_flight)
+        self.samples = RingBuffer(buffer_size)
+        self.sample_period = sample_period
+        self.detector = HysteresisEdgeDetector(controller.HIGH_VOLTAGE_THRESHOLD, controller.LOW_VOLTAGE_THRESHOLD, controller.previous_voltage_state)
+
+        self.events = queue.Queue(maxsize=max_pending_events)
+        self.callbacks = list(callbacks)
+        self.dropped_events = 0
+
+        self.phase = controller.motor_phase_enum
+        self.last_edge_time = None
+        self.last_block_time = None
+        self.blocks_read = 0
+        self.started_at = None
+
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.error = None
+
+    def start(self) -> None:
+        self.stop_event.clear()
+        self.started_at = time.perf_counter()
+        self.last_block_time = self.started_at
+        self.thread = threading.Thread(target=self._run, name="hall-sensor-reader", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        # keep the controller in step for code that still polls it directly
+        self.controller.motor_phase_enum = self.phase
+        self.controller.previous_voltage_state = self.detector.level
+
+    def sample_rate(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return self.samples.total / max(time.perf_counter() - self.started_at, 1e-9)
+
+    def _sample_times(self, count: int, received_at: float) -> np.ndarray:
+        if self.sample_period is not None:
+            return received_at - self.sample_period * np.arange(count - 1, -1, -1)
+        step = (received_at - self.last_block_time) / count
+        return self.last_block_time + step * np.arange(1, count + 1)
+
+    def _publish(self, event: PhaseEvent) -> None:
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            self.dropped_events += 1
+        for callback in self.callbacks:
+            callback(event)
+
+    def process_block(self, voltages: np.ndarray, received_at: float) -> None:
+        timestamps = self._sample_times(len(voltages), received_at)
+        self.last_block_time = received_at
+        self.samples.extend(voltages, timestamps)
+        self.blocks_read += 1
+
+        indices, levels = self.detector.process(voltages)
+        if len(indices) == 0:
+            return
+
+        edge_times = timestamps[indices]
+        previous_edge_time = edge_times[0] if self.last_edge_time is None else self.last_edge_time
+        intervals = np.diff(edge_times, prepend=previous_edge_time)
+        phases = (self.phase + np.arange(1, len(indices) + 1)) % self.controller.HALL_SENSOR_COUNT
+
+        self.last_edge_time = float(edge_times[-1])
+        self.phase = int(phases[-1])
+
+        for timestamp, phase, level, interval in zip(edge_times.tolist(), phases.tolist(), levels.tolist(), intervals.tolist()):
+            self._publish(PhaseEvent(timestamp, phase, level, interval))
+
+    def _run(self) -> None:
+        try:
+            with self.controller.lock:
+                self.controller.device.reset_input_buffer()
+                self.controller.request_voltage(self.requests_in_flight)
+            outstanding = self.requests_in_flight
+            while not self.stop_event.is_set():
+                voltages = self.controller.receive_voltage()
+                received_at = time.perf_counter()
+                outstanding -= 1
+                if outstanding <= self.requests_in_flight // 2:
+                    self.controller.request_voltage(self.requests_in_flight - outstanding)
+                    outstanding = self.requests_in_flight
+                self.process_block(np.asarray(voltages, dtype=np.float64), received_at)
+            # the answers still queued hold samples too: process them, which also leaves a clean stream for later reads
+            for _ in range(outstanding):
+                voltages = self.controller.receive_voltage()
+                self.process_block(np.asarray(voltages, dtype=np.float64), time.perf_counter())
+        except Exception as error:
+            # surfaced to the owner through self.error instead of dying silently
+            self.error = error
@@ -0,0 +1,132 @@
+import threading
+
+import numpy as np
+import serial
+import serial.tools.list_ports
+
+from .edges import find_edges
+
+# USB ids of the controller unit
+CONTROLLER_VID = 61525
+CONTROLLER_PID = 38912
+
+
+def find_controller_port() -> str:
+    for p in serial.tools.list_ports.comports():
+        if p.vid == CONTROLLER_VID and p.pid == CONTROLLER_PID:
+            return p.device
+    raise Exception('No controller unit detected')
+
+
+class STmic:
+    #device is any serial-like object, e.g. a Sync.simulator.SimulatedController; the USB controller is opened when omitted
+    def __init__(self, device=None):
+        self.device = serial.Serial(find_controller_port(), baudrate=115200) if device is None else device
+        self.lock = threading.RLock() #one command at a time, the reader and trigger threads share the port
+
+    def __del__(self):
+        if hasattr(self, 'device'):
+            self.device.close()
+
+    #no output buffer reset here, it would discard m1 requests a HallSensorReader has queued
+    def set_vdc(self, voltage):
+        cmd = 'dz' + str(int(voltage*100)).zfill(4) + '\r'
+        with self.lock:
+            self.device.write(bytes(cmd, 'utf-8'))
+
+    #motor related variables
+    HIGH_VOLTAGE_THRESHOLD = 3.0 #CONST #threshold before the voltage becomes high from undefined
+    LOW_VOLTAGE_THRESHOLD = 0.5 #CONST #theshold before the voltage becomes undefined
+    previous_voltage_state = 0 #0 for low voltage 1 for high voltage
+    motor_phase_enum = 0 #0-3199 for each hall sensor
+    HALL_SENSOR_COUNT = 3200
+    #projector related variables
+    current_image = 0 #current image index
+    projection_state = 0 #1 for start, 0 for stop(terminate), 2 for starting(projector is ready), 3 for initialising(projector is starting up)
+    image_lengths = [] #image_lengths = [1,3,3] means image 0 exposure duration is 1, image 1 exposure duration is 3,image 3 exposure duration is 3
+    exposure_counts = 0 #number of exposures the current image has already experienced
+
+    #m1 reads one block of 4 samples of both channels for 2v scale, answered with a line and 4*4 bytes
+    VOLTAGE_COMMAND = "m1" + "200000" + "1" + "160" + "130" + "1" + "160" + "130" + "\r"
+    VOLTAGE_BLOCK_BYTES = 4*4
+
+    #this method reads voltage for 2v scale, one block of 4 samples per call
+    #not to be used while a HallSensorReader streams from the same controller
+    def read_voltage(self):
+        with self.lock:
+            self.device.reset_output_buffer()
+            self.device.reset_input_buffer()
+            self.request_voltage()
+            return self.receive_voltage()
+
+    #queues count m1 commands in one write, the controller answers them in order
+    def request_voltage(self, count=1):
+        with self.lock:
+            self.device.write(bytes(self.VOLTAGE_COMMAND*count, 'utf-8'))
+
+    #waits for the answer to the oldest queued m1 command
+    def receive_voltage(self):
+        bytedata = bytearray(self.VOLTAGE_BLOCK_BYTES)
+        self.device.readline()
+        self.device.readinto(bytedata)
+        data = np.frombuffer(bytedata, dtype='uint16').reshape((2, 4))
+        raw1 = 7.9000*(1.94 - 1.5*data[0, :]/1700)
+        return raw1
+
+    def read_voltage_avg(self):
+        return float(np.array(self.read_voltage(), dtype=np.float64).mean())
+
+    #function digitises voltages level, outputs -1 for undefined voltage levels
+    #https://cdn.phidgets.com/docs/images/thumb/0/00/LogicLevel_visualization.jpg/450px-LogicLevel_visualization.jpg
+    def digitise_voltage(self, voltage):
+        if voltage >= self.HIGH_VOLTAGE_THRESHOLD:
+            return 1
+        if voltage <= self.LOW_VOLTAGE_THRESHOLD:
+            return 0
+        else:
+            return -1
+
+    #returns the number of voltage changes in one block of samples and updates the previous voltage state
+    #every sample is compared, so transitions inside a block are not averaged away
+    def is_voltage_changed(self):
+        indices, _, self.previous_voltage_state = find_edges(self.read_voltage(), self.HIGH_VOLTAGE_THRESHOLD, self.LOW_VOLTAGE_THRESHOLD, self.previous_voltage_state)
+        return len(indices)
+
+    def reset_projector(self):
+        self.projection_state = 0
+        self.exposure_counts = 0
+        self.current_image = 0
+
+    def reset_motor(self):
+        self.previous_voltage_state = 0
+        self.motor_phase_enum = 0
+
+    #this function is called when projector sends "image ready signal"
+    def initiate_pulses(self):
+        self.projection_state = 2
+
+    #exposes every image of image_lengths (self.image_lengths by default) with trigger pulses on the motor phases
+    #a HallSensorReader feeds a TriggerScheduler until every image is exposed or projection_state is set to 0 from another thread
+    #returns the scheduler, whose records and stats() hold the timing of every trigger
+    def start_operation(self, image_lengths=None):
+        from .acquisition import HallSensorReader #imported here, both modules import STmic
+        from .triggers import TriggerScheduler
+
+        scheduler = TriggerScheduler(self, image_lengths)
+        if not scheduler.image_lengths:
+            print("no images to expose")
+            return scheduler
+        scheduler.calibrate()
+        reader = HallSensorReader(self, callbacks=[scheduler.on_event])
+        scheduler.start()
+        reader.start()
+        try:
+            while self.projection_state != 0 and reader.error is None and scheduler.error is None:
+                scheduler.finished.wait(0.05)
+        finally:
+            reader.stop()
+            scheduler.stop()
+        if reader.error is not None or scheduler.error is not None:
+            raise reader.error or scheduler.error
+        print("operation ended")
+        return scheduler
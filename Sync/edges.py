@@ -0,0 +1,51 @@
+from typing import *
+
+import numpy as np
+
+
+def hysteresis_levels(samples: np.ndarray, high_threshold: float, low_threshold: float, initial_level: int) -> np.ndarray:
+    """
+    Digital level after every sample of a block, without a python loop
+    Samples above high_threshold are 1 and below low_threshold are 0; samples in between hold the
+    level of the last sample that crossed a threshold, or initial_level before the first one
+    """
+    levels = np.full(len(samples), -1, dtype=np.int8)
+    levels[samples > high_threshold] = 1
+    levels[samples < low_threshold] = 0
+
+    # forward fill: index of the last defined sample at every position, -1 before the first
+    last_defined = np.where(levels >= 0, np.arange(len(samples)), -1)
+    np.maximum.accumulate(last_defined, out=last_defined)
+
+    return np.where(last_defined >= 0, levels[last_defined], initial_level).astype(np.int8)
+
+
+def find_edges(samples: np.ndarray, high_threshold: float, low_threshold: float, initial_level: int) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Every level change in a block of samples
+    Returns the sample index of each edge, the level after each edge, and the level at the end of the block
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    if len(samples) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int8), initial_level
+
+    levels = hysteresis_levels(samples, high_threshold, low_threshold, initial_level)
+    indices = np.flatnonzero(np.diff(levels, prepend=np.int8(initial_level)))
+
+    return indices, levels[indices], int(levels[-1])
+
+
+class HysteresisEdgeDetector:
+    """
+    find_edges over consecutive blocks, carrying the level from one block to the next
+    """
+
+    def __init__(self, high_threshold: float, low_threshold: float, level: int = 0):
+        self.high_threshold = high_threshold
+        self.low_threshold = low_threshold
+        self.level = level
+
+    def process(self, samples: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # (index in samples, new level) of each edge
+        indices, levels, self.level = find_edges(samples, self.high_threshold, self.low_threshold, self.level)
+        return indices, levels
@@ -0,0 +1,348 @@
+"""
+Hardware-free serial backends for STmic
+
+SimulatedController answers the m1 (read ADC block) and dz (set output voltage) commands with a
+synthetic Hall sensor waveform at a configurable RPM and noise. SerialRecorder captures the blocks
+read from a real controller and ReplaySerial plays such a capture back. Any of them can be passed
+to STmic(device=...).
+
+Running this module benchmarks edge detection, or with --triggers the trigger scheduler, on the simulator:
+    python -m Sync.simulator --rpm 50 100 200 400 --noise 0.05
+    python -m Sync.simulator --rpm 20 --triggers 500 --link-latency 0.0002
+"""
+
+import argparse
+import collections
+import json
+import sys
+import time
+from typing import *
+
+import numpy as np
+
+from .controller import STmic
+
+
+def voltage_to_raw(voltages: np.ndarray) -> np.ndarray:
+    # inverse of the conversion in STmic.read_voltage
+    raw = (1.94 - voltages / 7.9) * 1700 / 1.5
+    return np.clip(np.round(raw), 0, 65535).astype('<u2')
+
+
+class HallWaveform:
+    """
+    Square wave of a Hall sensor on a motor turning at rpm, with one edge every 1/edges_per_revolution turn
+    set_rpm keeps the phase continuous, so the speed can change while the simulation runs
+    """
+
+    def __init__(self, rpm: float, edges_per_revolution: int = STmic.HALL_SENSOR_COUNT, high_voltage: float = 4.0,
+                 low_voltage: float = 0.1, noise: float = 0.0, start_time: float = 0.0, seed: int = 0):
+        self.edges_per_revolution = edges_per_revolution
+        self.high_voltage = high_voltage
+        self.low_voltage = low_voltage
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+
+        self.rpm = rpm
+        self.start_time = start_time
+        self.start_edges = 0.0
+
+    def edge_interval(self) -> float:
+        return 60 / (self.rpm * self.edges_per_revolution)
+
+    def edges_at(self, times: np.ndarray) -> np.ndarray:
+        # number of edges since the start, as a real number
+        return self.start_edges + (np.asarray(times) - self.start_time) / self.edge_interval()
+
+    def set_rpm(self, rpm: float, at_time: float) -> None:
+        self.start_edges = float(self.edges_at(at_time))
+        self.start_time = at_time
+        self.rpm = rpm
+
+    def voltages(self, times: np.ndarray) -> np.ndarray:
+        levels = np.floor(self.edges_at(times)).astype(np.int64) % 2
+        voltages = self.low_voltage + (self.high_voltage - self.low_voltage) * levels
+        if self.noise > 0:
+            voltages = voltages + self.rng.normal(0, self.noise, len(voltages))
+        return voltages
+
+    def edge_times(self, start: float, end: float) -> np.ndarray:
+        # times of every edge in [start, end), valid while the rpm stays the same
+        first = np.ceil(self.edges_at(start))
+        last = np.ceil(self.edges_at(end))
+        return self.start_time + (np.arange(first, last) - self.start_edges) * self.edge_interval()
+
+
+class SimulatedController:
+    """
+    Loopback stand-in for the controller's serial port
+    An m1 command samples the waveform samples_per_block times, sample_period apart, ending at the
+    time of the command but never overlapping the previous block, so no sample is read twice. Like
+    the ADC, a block is not answered before its last sample has been taken: writes return at once
+    and reads wait for the answers, so queued m1 commands are sampled back to back.
+    Every dz command is logged with its time in voltage_log
+    """
+
+    def __init__(self, waveform: HallWaveform, samples_per_block: int = 4, sample_period: float = 50e-6,
+                 clock: Callable[[], float] = time.perf_counter, link_latency: float = 0.0):
+        self.waveform = waveform
+        self.samples_per_block = samples_per_block
+        self.sample_period = sample_period
+        self.clock = clock
+        self.link_latency = link_latency
+
+        self.pending = bytearray() # answers ready to be read
+        self.scheduled = collections.deque() # (time of the last sample, answer) of blocks still being sampled
+        self.first_sample_time = None
+        self.last_sample_time = -np.inf
+        self.output_voltage = 0.0
+        self.voltage_log = [] # (time, voltage) of every dz command
+
+    def reset_output_buffer(self) -> None:
+        pass
+
+    def reset_input_buffer(self) -> None:
+        self.pending.clear()
+        self.scheduled.clear()
+
+    def write(self, data: bytes) -> int:
+        if self.link_latency > 0:
+            time.sleep(self.link_latency)
+        for command in data.decode('utf-8').split('\r'):
+            self.handle(command)
+        return len(data)
+
+    def handle(self, command: str) -> None:
+        if command.startswith('m1'):
+            first = max(self.clock() - self.sample_period * (self.samples_per_block - 1), self.last_sample_time + self.sample_period)
+            times = first + self.sample_period * np.arange(self.samples_per_block)
+            self.last_sample_time = times[-1]
+            if self.first_sample_time is None:
+                self.first_sample_time = times[0]
+            channel1 = voltage_to_raw(self.waveform.voltages(times))
+            channel2 = np.zeros(self.samples_per_block, dtype='<u2')
+            self.scheduled.append((times[-1], b'm1\r\n' + np.stack([channel1, channel2]).tobytes()))
+        elif command.startswith('dz'):
+            self.output_voltage = int(command[2:]) / 100
+            self.voltage_log.append((self.clock(), self.output_voltage))
+
+    def _wait_for(self, ready: Callable[[], bool]) -> None:
+        # move sampled answers to pending until ready() holds or nothing is left to wait for
+        while True:
+            while self.scheduled and self.scheduled[0][0] <= self.clock():
+                self.pending += self.scheduled.popleft()[1]
+            if ready() or not self.scheduled:
+                return
+            time.sleep(max(self.scheduled[0][0] - self.clock(), 0))
+
+    def readline(self) -> bytes:
+        self._wait_for(lambda: b'\n' in self.pending)
+        end = self.pending.find(b'\n')
+        if end < 0:
+            return b''
+        line = bytes(self.pending[:end + 1])
+        del self.pending[:end + 1]
+        return line
+
+    def readinto(self, buffer: bytearray) -> int:
+        self._wait_for(lambda: len(self.pending) >= len(buffer))
+        count = min(len(buffer), len(self.pending))
+        buffer[:count] = self.pending[:count]
+        del self.pending[:count]
+        return count
+
+    def close(self) -> None:
+        pass
+
+
+class SerialRecorder:
+    """
+    Wraps a real serial port and records every ADC block read through it
+    """
+
+    def __init__(self, device: Any, clock: Callable[[], float] = time.perf_counter):
+        self.device = device
+        self.clock = clock
+        self.times = []
+        self.blocks = []
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.device, name)
+
+    def readinto(self, buffer: bytearray) -> int:
+        count = self.device.readinto(buffer)
+        self.times.append(self.clock())
+        self.blocks.append(bytes(buffer[:count]))
+        return count
+
+    def save(self, path: str) -> None:
+        times = np.array(self.times, dtype=np.float64)
+        blocks = np.frombuffer(b''.join(self.blocks), dtype=np.uint8).reshape(len(self.blocks), -1)
+        np.savez(path, times=times - times[0] if len(times) else times, blocks=blocks)
+
+
+class ReplaySerial:
+    """
+    Serves the blocks of a SerialRecorder capture in order, one per m1 command
+    With realtime, each block is not answered before its recorded offset from the first one.
+    An m1 command after the last block raises EOFError, which stops a HallSensorReader
+    """
+
+    def __init__(self, path: str, realtime: bool = False, clock: Callable[[], float] = time.perf_counter):
+        capture = np.load(path)
+        self.times = capture['times']
+        self.blocks = capture['blocks']
+        self.realtime = realtime
+        self.clock = clock
+
+        self.position = 0
+        self.started_at = None
+        self.pending = bytearray()
+        self.scheduled = collections.deque()
+        self.voltage_log = []
+
+    def reset_output_buffer(self) -> None:
+        pass
+
+    def reset_input_buffer(self) -> None:
+        self.pending.clear()
+        self.scheduled.clear()
+
+    def write(self, data: bytes) -> int:
+        for command in data.decode('utf-8').split('\r'):
+            if command.startswith('m1'):
+                self.next_block()
+            elif command.startswith('dz'):
+                self.voltage_log.append((self.clock(), int(command[2:]) / 100))
+        return len(data)
+
+    def next_block(self) -> None:
+        if self.position >= len(self.blocks):
+            raise EOFError('Recording exhausted')
+        if self.started_at is None:
+            self.started_at = self.clock()
+        answer = b'm1\r\n' + self.blocks[self.position].tobytes()
+        if self.realtime:
+            self.scheduled.append((self.started_at + self.times[self.position], answer))
+        else:
+            self.pending += answer
+        self.position += 1
+
+    _wait_for = SimulatedController._wait_for
+    readline = SimulatedController.readline
+    readinto = SimulatedController.readinto
+
+    def close(self) -> None:
+        pass
+
+
+def benchmark_edge_detection(rpm: float, noise: float, duration: float, sample_period: float, link_latency: float) -> Dict[str, Any]:
+    """
+    Run a HallSensorReader against the simulator and compare the detected edges with the true ones
+    """
+    from .acquisition import HallSensorReader
+
+    start = time.perf_counter()
+    waveform = HallWaveform(rpm, noise=noise, start_time=start)
+    simulator = SimulatedController(waveform, sample_period=sample_period, link_latency=link_latency)
+    controller = STmic(simulator)
+
+    latencies = []
+
+    def measure_latency(event):
+        # delay between the true edge and the moment its event is published
+        true_edges = waveform.edge_times(event.timestamp - waveform.edge_interval(), event.timestamp + waveform.edge_interval())
+        if len(true_edges):
+            nearest = true_edges[np.argmin(np.abs(true_edges - event.timestamp))]
+            latencies.append(time.perf_counter() - nearest)
+
+    reader = HallSensorReader(controller, sample_period=sample_period, callbacks=[measure_latency])
+    reader.start()
+    time.sleep(duration)
+    reader.stop()
+    end = time.perf_counter()
+
+    expected = len(waveform.edge_times(simulator.first_sample_time, simulator.last_sample_time))
+    detected = len(latencies)
+    latencies = np.array(latencies) if latencies else np.zeros(1)
+
+    return {
+        "rpm": rpm,
+        "noise": noise,
+        "expected_edges": expected,
+        "detected_edges": detected,
+        "detected_ratio": detected / expected if expected else 0.0,
+        "sample_rate": reader.sample_rate(),
+        "block_rate": reader.blocks_read / (end - start),
+        "latency_p50_s": float(np.percentile(latencies, 50)),
+        "latency_p99_s": float(np.percentile(latencies, 99)),
+        "latency_jitter_s": float(np.std(latencies)),
+    }
+
+
+def benchmark_triggers(rpm: float, noise: float, trigger_count: int, sample_period: float, link_latency: float) -> Dict[str, Any]:
+    """
+    Run a TriggerScheduler on a simulated motor and measure where its rising edges land
+    against the true Hall edges
+    """
+    from .acquisition import HallSensorReader
+    from .triggers import TriggerScheduler
+
+    waveform = HallWaveform(rpm, noise=noise, start_time=time.perf_counter())
+    simulator = SimulatedController(waveform, sample_period=sample_period, link_latency=link_latency)
+    controller = STmic(simulator)
+
+    scheduler = TriggerScheduler(controller, image_lengths=[1] * trigger_count)
+    scheduler.calibrate()
+    reader = HallSensorReader(controller, sample_period=sample_period, callbacks=[scheduler.on_event])
+    scheduler.start()
+    reader.start()
+    scheduler.finished.wait(timeout=trigger_count * waveform.edge_interval() * 4 + 5)
+    reader.stop()
+    scheduler.stop()
+
+    # the simulator logs a dz command when the write reaches it
+    rising = np.array([logged for logged, voltage in simulator.voltage_log if voltage == scheduler.trigger_voltage])
+    offsets = np.empty(0)
+    if len(rising):
+        true_edges = waveform.edge_times(rising.min() - waveform.edge_interval(), rising.max() + waveform.edge_interval())
+        following = np.clip(np.searchsorted(true_edges, rising), 1, len(true_edges) - 1)
+        offsets = rising - true_edges[following]
+        before = rising - true_edges[following - 1]
+        offsets = np.where(np.abs(before) < np.abs(offsets), before, offsets)
+
+    return {
+        "rpm": rpm,
+        "edge_interval_s": waveform.edge_interval(),
+        **scheduler.stats(),
+        "true_edge_offset_mean_s": float(offsets.mean()) if len(offsets) else None,
+        "true_edge_jitter_s": float(offsets.std()) if len(offsets) else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Hall edge detection against the simulated controller")
+    parser.add_argument("--rpm", type=float, nargs="+", default=[50, 100, 200, 400])
+    parser.add_argument("--noise", type=float, default=0.05, help="standard deviation of the voltage noise")
+    parser.add_argument("--duration", type=float, default=1.0, help="seconds per run")
+    parser.add_argument("--sample-period", type=float, default=50e-6, help="seconds between the samples of a block")
+    parser.add_argument("--link-latency", type=float, default=0.0, help="simulated serial write latency in seconds")
+    parser.add_argument("--triggers", type=int, default=0, help="benchmark the trigger scheduler with this many triggers instead")
+    arguments = parser.parse_args()
+
+    if arguments.triggers > 0:
+        results = [benchmark_triggers(rpm, arguments.noise, arguments.triggers, arguments.sample_period, arguments.link_latency) for rpm in arguments.rpm]
+        json.dump({"results": results}, sys.stdout, indent=2)
+        print()
+        return
+
+    results = [benchmark_edge_detection(rpm, arguments.noise, arguments.duration, arguments.sample_period, arguments.link_latency) for rpm in arguments.rpm]
+
+    # the highest speed at which the detected edges match the true ones within 1%
+    sustainable = [result["rpm"] for result in results if abs(result["detected_edges"] - result["expected_edges"]) <= max(1, result["expected_edges"] // 100)]
+    json.dump({"results": results, "max_sustainable_rpm": max(sustainable) if sustainable else None}, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
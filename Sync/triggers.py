@@ -0,0 +1,181 @@
+import queue
+import threading
+import time
+from typing import *
+
+import numpy as np
+
+from .acquisition import PhaseEvent
+from .controller import STmic
+
+
+def wait_until(deadline: float) -> None:
+    # sleep most of the way, then spin for the last millisecond
+    while True:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            return
+        if remaining > 0.001:
+            time.sleep(remaining - 0.001)
+
+
+class TriggerRecord(NamedTuple):
+    image: int # index into image_lengths of the exposed image
+    exposure: int # exposure of that image, from 1 to image_lengths[image]
+    phase: int # motor phase the rising edge should land on
+    target_time: float # predicted time of that phase
+    sent_time: float # when the rising edge write started
+    completed_time: float # when it returned, i.e. when the controller has the command
+    late: bool # the target had already passed when the event was handled
+    edge_time: Optional[float] = None # measured time of the target phase, filled in when its event arrives
+
+    @property
+    def error(self) -> float:
+        return self.completed_time - self.target_time
+
+
+class TriggerScheduler:
+    """
+    Turns Hall phase events into trigger pulses on the controller's output
+    Every edge predicts the time of the next one from the last interval, and the rising edge is
+    written early by the measured serial write latency so it reaches the controller on that phase.
+    Triggers start on start_phase and each image gets image_lengths[image] exposures. Events
+    handled more than one interval after their target are counted in missed_events without a pulse.
+    STmic.start_operation runs one with a HallSensorReader. Pass on_event as a
+    HallSensorReader callback; pulses are sent from the scheduler's own thread so the reader never
+    waits on them
+    """
+
+    def __init__(self, controller: STmic, image_lengths: Optional[Sequence[int]] = None, pulse_width: float = 0.0,
+                 trigger_voltage: float = 4, idle_voltage: float = 0.2, start_phase: int = 1, latency_smoothing: float = 0.1):
+        self.controller = controller
+        self.image_lengths = list(controller.image_lengths if image_lengths is None else image_lengths)
+        self.pulse_width = pulse_width
+        self.trigger_voltage = trigger_voltage
+        self.idle_voltage = idle_voltage
+        self.start_phase = start_phase
+        self.latency_smoothing = latency_smoothing
+
+        self.write_latency = 0.0
+        self.records = []
+        self.awaiting_edge = {} # target phase -> index into records
+        self.skipped_events = 0
+        self.missed_events = 0
+
+        self.events = queue.Queue()
+        self.stop_event = threading.Event()
+        self.finished = threading.Event()
+        self.thread = None
+        self.error = None
+
+    def calibrate(self, samples: int = 32) -> float:
+        # median duration of an idle write, used until real triggers refine it
+        durations = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            self.controller.set_vdc(self.idle_voltage)
+            durations.append(time.perf_counter() - start)
+        self.write_latency = float(np.median(durations))
+        return self.write_latency
+
+    def on_event(self, event: PhaseEvent) -> None:
+        self.events.put(event)
+
+    def start(self) -> None:
+        self.controller.reset_projector()
+        self.controller.image_lengths = self.image_lengths
+        self.controller.initiate_pulses()
+        self.stop_event.clear()
+        self.finished.clear()
+        self.thread = threading.Thread(target=self._run, name="trigger-scheduler", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.controller.set_vdc(self.idle_voltage)
+
+    def pulse(self, target_time: float) -> Tuple[float, float]:
+        wait_until(target_time - self.write_latency)
+        sent_time = time.perf_counter()
+        self.controller.set_vdc(self.trigger_voltage)
+        completed_time = time.perf_counter()
+        self.write_latency += self.latency_smoothing * (completed_time - sent_time - self.write_latency)
+
+        wait_until(completed_time + self.pulse_width)
+        self.controller.set_vdc(self.idle_voltage)
+        return sent_time, completed_time
+
+    def handle(self, event: PhaseEvent) -> None:
+        controller = self.controller
+
+        if event.phase in self.awaiting_edge:
+            index = self.awaiting_edge.pop(event.phase)
+            self.records[index] = self.records[index]._replace(edge_time=event.timestamp)
+
+        if controller.projection_state == 2 and event.phase == self.start_phase:
+            controller.projection_state = 1
+        if controller.projection_state != 1:
+            return
+
+        if event.interval <= 0:
+            # no speed estimate yet for the first edge
+            self.skipped_events += 1
+            return
+
+        target_phase = (event.phase + 1) % controller.HALL_SENSOR_COUNT
+        target_time = event.timestamp + event.interval
+        now = time.perf_counter()
+        if now > target_time + event.interval:
+            # the pulses cannot keep up with the motor, catch up with the newest events instead of piling up
+            self.missed_events += 1
+            return
+        late = now + self.write_latency > target_time
+        sent_time, completed_time = self.pulse(target_time)
+
+        controller.exposure_counts += 1
+        self.awaiting_edge[target_phase] = len(self.records)
+        self.records.append(TriggerRecord(controller.current_image, controller.exposure_counts, target_phase, target_time, sent_time, completed_time, late))
+
+        if controller.exposure_counts >= self.image_lengths[controller.current_image]:
+            controller.current_image += 1
+            controller.exposure_counts = 0
+            if controller.current_image >= len(self.image_lengths):
+                controller.projection_state = 0
+                self.finished.set()
+
+    def _run(self) -> None:
+        try:
+            while not self.stop_event.is_set() and not self.finished.is_set():
+                try:
+                    event = self.events.get(timeout=0.05)
+                except queue.Empty:
+                    continue
+                self.handle(event)
+        except Exception as error:
+            self.error = error
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Timing error of the triggers against their predicted phase times, and against the
+        measured phase times where the following edge has been seen
+        """
+        if not self.records:
+            return {"triggers": 0}
+        errors = np.array([record.error for record in self.records])
+        landed = np.array([record.completed_time - record.edge_time for record in self.records if record.edge_time is not None])
+        result = {
+            "triggers": len(self.records),
+            "late": sum(record.late for record in self.records),
+            "skipped_events": self.skipped_events,
+            "missed_events": self.missed_events,
+            "write_latency_s": self.write_latency,
+            "error_mean_s": float(errors.mean()),
+            "error_p99_s": float(np.percentile(np.abs(errors), 99)),
+            "jitter_s": float(errors.std()),
+        }
+        if len(landed):
+            result.update({"phase_error_mean_s": float(landed.mean()), "phase_jitter_s": float(landed.std())})
+        return result